@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 11:02:33 2026
+
+@author: david
+"""
+
+#%% Load packages
+import time
+import warnings
+import itertools
+import argparse
+import numpy as np
+import pandas as pd
+from modelload import variants, loadmodel, outputs
+from solve import steady
+
+#%% Reference solution
+
+# Per mil requirement on every isotopes column
+target = 0.001
+
+# High precision steady state: tight tolerances and ten times the script
+# horizon. The same solve to the script horizon is returned as a check that
+# the reference itself has stopped moving. LSODA gives up with repeated
+# error test failures below rtol ~ 1e-11, so 1e-10 is the tightest default.
+def reference(ns, rtol = 1e-10, atol = 1e-10):
+    tend = 10 * ns['tgrid'][1]
+    y, info = steady(ns, tend = tend, rtol = rtol, atol = atol, npts = 241)
+    ycheck, infocheck = steady(ns, rtol = rtol, atol = atol, npts = 241)
+    if not (info['success'] and infocheck['success']):
+        raise RuntimeError('reference solve failed: %s' % info['message'])
+    isotopes = outputs(ns, np.vstack([y, ycheck]))[0]
+    drift = np.nanmax(np.abs(isotopes.iloc[0] - isotopes.iloc[1]))
+    return y, isotopes.iloc[0], drift;
+
+#%% Sweep of solver settings
+
+# Default sweep: solver method, relative tolerance, convergence criterion
+# and whether the solver works in scaled variables (solve.magnitudes).
+# A criterion is either a fixed horizon in years ('tend') or a decade by
+# decade stop once the relative change over a decade drops below a value.
+# Radau is left out by default; with a finite difference Jacobian of the
+# Python RHS it costs minutes per trial.
+sweep = {'method': ['odeint', 'LSODA', 'BDF'],
+         'rtol': [1e-3, 1e-4, 1e-6, 1e-8, 1e-10],
+         'atol': [None],
+         'criterion': [('tend', 1e4), ('tend', 1e5), ('tend', 1e6),
+                       ('stop', 1e-6), ('stop', 1e-9)],
+         'scale': [False]}
+
+# Solve with one combination of settings and return time, work and the
+# absolute error in every isotopes column against the reference
+def trial(ns, isoref, method, rtol, atol, criterion, scale = False):
+    kind, value = criterion
+    scale = True if scale else None
+    t0 = time.perf_counter()
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            if kind == 'tend':
+                y, info = steady(ns, tend = value, rtol = rtol, atol = atol,
+                                 method = method, scale = scale)
+            else:
+                y, info = steady(ns, rtol = rtol, atol = atol, method = method,
+                                 stop = value, scale = scale)
+        success = info['success']
+    except Exception as err:
+        y, info, success = np.full(len(ns['y0']), np.nan), {'message': str(err)}, False
+    wall = time.perf_counter() - t0
+    isotopes = outputs(ns, y)[0].iloc[0]
+    err = (isotopes - isoref).abs()[isoref.notna()]
+    row = {'method': method, 'rtol': rtol, 'atol': atol,
+           'criterion': '%s=%g' % criterion, 'scaled': scale is not None, 'wall_s': wall,
+           'nfe': info.get('nfe'), 'nje': info.get('nje'),
+           'tstop': info.get('tstop'), 'success': success,
+           'maxerr': err.max(skipna = False) if success else np.nan}
+    row.update(('err_' + key, value) for key, value in err.items())
+    return row;
+
+# Wall time against error for every combination of settings of one variant
+def accuracy(name, sweep = sweep, verbose = True):
+    ns = loadmodel(name)
+    yref, isoref, drift = reference(ns)
+    if verbose:
+        print('%s: reference drift between 1e6 and 1e7 years %.2e per mil' % (name, drift))
+    rows = []
+    keys = list(sweep)
+    for combo in itertools.product(*[sweep[key] for key in keys]):
+        row = trial(ns, isoref, **dict(zip(keys, combo)))
+        row['variant'] = name
+        rows.append(row)
+        if verbose:
+            print('  %-7s rtol=%-6g %-12s %-6s %8.3f s  max err %.2e' % (row['method'],
+                  row['rtol'], row['criterion'], 'scaled' if row['scaled'] else 'moles',
+                  row['wall_s'], row['maxerr']))
+    table = pd.DataFrame(rows)
+    table['meets'] = table['maxerr'] <= target
+    return table;
+
+# Cheapest settings of each variant that keep every isotopes column within tol
+def cheapest(table, tol = target):
+    ok = table[table['maxerr'] <= tol]
+    return ok.loc[ok.groupby('variant')['wall_s'].idxmin()][['variant', 'method',
+           'rtol', 'atol', 'criterion', 'scaled', 'wall_s', 'maxerr']];
+
+#%% Run from the command line
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Solver accuracy against cost for the model variants')
+    parser.add_argument('variants', nargs = '*', default = list(variants))
+    parser.add_argument('--methods', nargs = '+', default = sweep['method'],
+                        help = 'any of odeint, LSODA, BDF, Radau')
+    parser.add_argument('--rtols', nargs = '+', type = float, default = sweep['rtol'])
+    parser.add_argument('--scale', action = 'store_true',
+                        help = 'also solve in scaled variables')
+    parser.add_argument('--out', default = 'accuracy.csv')
+    args = parser.parse_args(argv)
+
+    settings = dict(sweep, method = args.methods, rtol = args.rtols,
+                    scale = [False, True] if args.scale else [False])
+    table = pd.concat([accuracy(name, settings) for name in args.variants],
+                      ignore_index = True)
+    table.to_csv(args.out, index = False)
+    print(cheapest(table).to_string(index = False))
+    return table;
+
+if __name__ == '__main__':
+    main()
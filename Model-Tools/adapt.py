@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 01:02:38 2026
+
+@author: david
+"""
+
+#%% Load packages
+import time
+import itertools
+import argparse
+import numpy as np
+import pandas as pd
+from scipy.interpolate import RegularGridInterpolator
+from modelload import variants, outputs
+from newton import invariants, nearby
+from grid import models, grid
+
+#%% Interpolation error
+
+# Error of piecewise linear interpolation on each interval of a sampled
+# curve (x increasing, one column of v per output): |f''| h^2 / 8, with f''
+# the second divided difference of the three points either side of the
+# interval, whichever is larger, so an interval is refined when it or its
+# neighbour bends. Outputs that are NaN do not count.
+def intervalerror(x, v):
+    x = np.asarray(x, dtype = float)
+    v = np.asarray(v, dtype = float).reshape(len(x), -1)
+    h = np.diff(x)
+    slope = np.diff(v, axis = 0) / h[:, None]
+    bend = np.abs(2 * np.diff(slope, axis = 0) / (x[2:] - x[:-2])[:, None])
+    curve = np.zeros(slope.shape)
+    curve[:-1] = bend
+    curve[1:] = np.fmax(curve[1:], bend)
+    return np.nan_to_num(curve) * h[:, None] ** 2 / 8;
+
+# Error of each interval of one axis of a sampled cube (axes first, then
+# the outputs, each divided by its tolerance), the largest over every line
+# along that axis
+def axiserror(x, cube, axis):
+    lines = np.moveaxis(cube, axis, 0)
+    lines = lines.reshape(len(x), -1)
+    return intervalerror(x, lines).max(axis = 1);
+
+#%% Solving points
+
+# Steady state at one point (axis: value) from the nearest point solved
+# so far, in units of each axis span, reusing its factorisation. solved maps
+# points (tuples of values in axis order) to their state, factorisation and
+# outputs, and the new point is added to it. Returns the work.
+def solveat(name, point, solved, C, spans, params = {}, tol = 1e-10, theta = 0.5):
+    t0 = time.perf_counter()
+    ns = next(models(name, [point], params))
+    key = tuple(point.values())
+    start, fac = None, None
+    if solved:
+        near = min(solved, key = lambda other: sum(((a - b) / span) ** 2
+                   for a, b, span in zip(key, other, spans)))
+        start, fac = solved[near]['y'], solved[near]['fac']
+    y, fac, row = nearby(ns, start, fac, C, tol, theta)
+    isotopes, fracflux = outputs(ns, y)
+    solved[key] = {'y': y, 'fac': fac,
+                   'outputs': pd.concat([isotopes, fracflux], axis = 1).iloc[0]}
+    row['wall_s'] = time.perf_counter() - t0
+    return row;
+
+#%% Adaptive sampling
+
+# Steady states over the product of parameter axes (name: (low, high),
+# slowest first, one axis for a curve and two for a surface) sampled
+# densely only where the response bends. Every axis starts from start even
+# points; each round the interpolation error of every interval of every
+# axis is estimated from the curvature of the outputs named in tol (output:
+# tolerance, per mil or the output's units, or one tolerance for
+# D17_O2t), and the intervals whose error is over the tolerance for any
+# output along any line of the grid are halved. Axes stay rectilinear, so a
+# new value on one axis is solved along every value of the others. Stops
+# when no interval is over its tolerance, when maxpoints would be passed
+# (the worst intervals are then halved first) or when the intervals left
+# are narrower than minwidth of the axis span. New points are warm started
+# from the nearest point solved (see solveat).
+#
+# Returns the cube, the states and the work as grid does (DataFrames
+# indexed by the axes); work also holds the round each point was added in,
+# and work.attrs the largest error left (in tolerances) and whether the
+# target was met.
+def refine(name, axes, tol = 1e-3, start = 5, maxpoints = 400, minwidth = 1e-4,
+           solvetol = 1e-10, theta = 0.5, **params):
+    names = list(axes)
+    tol = tol if isinstance(tol, dict) else {'D17_O2t': tol}
+    spans = [axes[axis][1] - axes[axis][0] for axis in names]
+    values = [list(np.linspace(*axes[axis], start)) for axis in names]
+    solved, rows, C = {}, [], None
+    t0 = time.perf_counter()
+    new = list(itertools.product(*values))
+    for stage in itertools.count():
+        for key in new:
+            point = dict(zip(names, key))
+            if C is None:
+                C = invariants(next(models(name, [point], params)))
+            row = solveat(name, point, solved, C, spans, params, solvetol, theta)
+            rows.append(dict(point, round = stage, **row))
+
+        # Interpolation error of every interval, in tolerances
+        shape = [len(v) for v in values]
+        cube = np.array([[solved[key]['outputs'][output] / size for output, size in tol.items()]
+                         for key in itertools.product(*values)]).reshape(shape + [len(tol)])
+        errors = [axiserror(v, cube, a) for a, v in enumerate(values)]
+        worst = max(e.max() for e in errors)
+        bad = [(e[i], a, i) for a, e in enumerate(errors) for i in range(len(e))
+               if e[i] > 1 and values[a][i + 1] - values[a][i] > minwidth * spans[a]]
+        if not bad:
+            break
+
+        # Halve the worst intervals the point budget allows
+        bad.sort(reverse = True)
+        added = [[] for axis in names]
+        for error, a, i in bad:
+            more = [len(v) + len(extra) for v, extra in zip(values, added)]
+            more[a] += 1
+            if np.prod(more) > maxpoints:
+                continue
+            added[a].append((values[a][i] + values[a][i + 1]) / 2)
+        if not any(added):
+            break
+        old = set(itertools.product(*values))
+        values = [sorted(v + extra) for v, extra in zip(values, added)]
+        new = [key for key in itertools.product(*values) if key not in old]
+
+    index = pd.MultiIndex.from_product(values, names = names)
+    keys = list(itertools.product(*values))
+    out = pd.DataFrame([solved[key]['outputs'] for key in keys], index = index)
+    states = pd.DataFrame(np.array([solved[key]['y'] for key in keys]), index = index,
+                          columns = next(models(name, [dict(zip(names, keys[0]))], params))['moleso'])
+    work = pd.DataFrame(rows).set_index(names)
+    work.attrs = {'wall_s': time.perf_counter() - t0, 'error': worst, 'converged': worst <= 1}
+    return out, states, work;
+
+# Outputs of an adaptive cube interpolated (linearly, as refine assumes) at
+# the points of an index of the same axes
+def interpolate(cube, index, columns):
+    values = [np.unique(cube.index.get_level_values(i)) for i in range(cube.index.nlevels)]
+    shape = [len(v) for v in values]
+    points = np.column_stack([index.get_level_values(i) for i in range(index.nlevels)])
+    return pd.DataFrame({column: RegularGridInterpolator(values, cube[column].values.reshape(shape))(points)
+                         for column in columns}, index = index);
+
+#%% Run from the command line
+
+# Adaptive sampling of a variant over one or two axes against the evenly
+# spaced grid of the scripts, e.g.
+#     python adapt.py Young2014 --axis tresp 0.505 0.530 --even 50
+#     python adapt.py sbmodWB --axis k41 0.1 10 --even 50
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Adaptive sampling of steady state responses')
+    parser.add_argument('variant', nargs = '?', default = 'Young2014', choices = list(variants))
+    parser.add_argument('--axis', nargs = 3, action = 'append', metavar = ('NAME', 'LOW', 'HIGH'),
+                        help = 'axis NAME from LOW to HIGH, slowest first')
+    parser.add_argument('--tol', nargs = 2, action = 'append', metavar = ('OUTPUT', 'TOL'),
+                        help = 'interpolation tolerance of OUTPUT (default D17_O2t 1e-3)')
+    parser.add_argument('--start', type = int, default = 5)
+    parser.add_argument('--maxpoints', type = int, default = 400)
+    parser.add_argument('--even', type = int, default = 0,
+                        help = 'check against NUM evenly spaced values of every axis')
+    args = parser.parse_args(argv)
+
+    axes = {axis: (float(low), float(high)) for axis, low, high in args.axis or [('tresp', 0.505, 0.530)]}
+    tol = {output: float(size) for output, size in args.tol} if args.tol else {'D17_O2t': 1e-3}
+    cube, states, work = refine(args.variant, axes, tol, args.start, args.maxpoints)
+    for axis in axes:
+        print('%s: %d values %s' % (axis, cube.index.get_level_values(axis).nunique(),
+              np.array2string(np.unique(cube.index.get_level_values(axis)), precision = 4)))
+    print('%d points in %d rounds, %.2f s, nfe %d, largest error estimate %.2f tolerances%s' % (len(work),
+          work['round'].max() + 1, work.attrs['wall_s'], work['nfe'].sum(), work.attrs['error'],
+          '' if work.attrs['converged'] else ' (point budget or minwidth reached)'))
+    if args.even:
+        even, _, ework = grid(args.variant, {axis: np.linspace(*span, args.even) for axis, span in axes.items()},
+                              processes = 1)
+        fit = interpolate(cube, even.index, list(tol))
+        for output, size in tol.items():
+            miss = np.abs(fit[output] - even[output])
+            print('%s against %d even points (%.2f s): largest difference %.2e (tolerance %.0e), rms %.2e' % (
+                  output, len(even), ework.attrs['wall_s'], miss.max(), size, np.sqrt((miss ** 2).mean())))
+    return cube;
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 10:05:17 2026
+
+@author: david
+"""
+
+#%% Load packages
+import os
+import sys
+import json
+import time
+import timeit
+import platform
+import resource
+import argparse
+import subprocess
+import multiprocessing as mp
+import numpy as np
+import scipy
+from modelload import root, variants, loadmodel, outputs
+from solve import steady
+
+#%% Benchmark of a single variant
+
+# Default location of the benchmark history, one JSON record per line
+history = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       'benchhistory.jsonl')
+
+# Current commit of the repository, so records can be compared across commits
+def commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd = root,
+                             capture_output = True, text = True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None;
+
+# Time loading, one RHS evaluation and the steady state solve of a variant.
+# Runs in its own process so peak RSS belongs to this variant alone.
+def benchvariant(name, repeat = 3, nrhs = 2000):
+    t0 = time.perf_counter()
+    ns = loadmodel(name)
+    tload = time.perf_counter() - t0
+
+    # Cost of a single RHS evaluation at the initial conditions
+    f, y0 = ns['f'], ns['y0']
+    trhs = min(timeit.repeat(lambda: f(y0, 0), number = nrhs, repeat = 3)) / nrhs
+
+    # Best of several steady state solves
+    tsolve = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        y, info = steady(ns)
+        tsolve.append(time.perf_counter() - t0)
+    isotopes, fracflux = outputs(ns, y)
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        rss = rss / 1024
+    return {'variant': name,
+            'load_s': tload,
+            'rhs_us': trhs * 1e6,
+            'solve_s': min(tsolve),
+            'solve_s_all': tsolve,
+            'peak_rss_mb': rss / 1024,
+            'nst': info['nst'],
+            'nfe': info['nfe'],
+            'nje': info['nje'],
+            'switches': info['switches'],
+            'D17_O2t': float(isotopes['D17_O2t'][0]),
+            'xJ': float(fracflux['xJ'][0])};
+
+# Run benchvariant in a fresh spawned process and return its record
+def runisolated(name, repeat = 3):
+    ctx = mp.get_context('spawn')
+    with ctx.Pool(1) as pool:
+        return pool.apply(benchvariant, (name, repeat));
+
+#%% History
+
+# Environment shared by every record of one benchmark run
+def environment():
+    return {'commit': commit(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'host': platform.node(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'scipy': scipy.__version__};
+
+# Append records to the history file
+def record(records, path = history):
+    with open(path, 'a') as file:
+        for rec in records:
+            file.write(json.dumps(rec) + '\n')
+
+# Most recent earlier record of each variant in the history file
+def lastrecords(path = history):
+    last = {}
+    if os.path.exists(path):
+        with open(path) as file:
+            for line in file:
+                if line.strip():
+                    rec = json.loads(line)
+                    last[rec['variant']] = rec
+    return last;
+
+# Compare a record with the previous one; a regression is a slowdown of the
+# solve or RHS cost beyond tol, or a rise in solver work (steps, RHS and
+# Jacobian evaluations) beyond worktol (both fractional). Less work is not
+# a regression.
+def compare(rec, prev, tol = 0.2, worktol = 0.05):
+    notes = []
+    for key in ['solve_s', 'rhs_us', 'peak_rss_mb']:
+        if prev.get(key) and rec[key] > prev[key] * (1 + tol):
+            notes.append('%s %.3g -> %.3g' % (key, prev[key], rec[key]))
+    for key in ['nst', 'nfe', 'nje']:
+        if prev.get(key) and rec[key] > prev[key] * (1 + worktol):
+            notes.append('%s %d -> %d' % (key, prev[key], rec[key]))
+    if prev.get('D17_O2t') is not None and abs(rec['D17_O2t'] - prev['D17_O2t']) > 1e-3:
+        notes.append('D17_O2t %.4f -> %.4f' % (prev['D17_O2t'], rec['D17_O2t']))
+    return notes;
+
+#%% Run the suite
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Benchmark steady state solves of the model variants')
+    parser.add_argument('variants', nargs = '*', default = list(variants))
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--history', default = history)
+    parser.add_argument('--tol', type = float, default = 0.2,
+                        help = 'fractional slowdown reported as a regression')
+    parser.add_argument('--worktol', type = float, default = 0.05,
+                        help = 'fractional rise in solver work reported as a regression')
+    parser.add_argument('--no-record', action = 'store_true')
+    args = parser.parse_args(argv)
+
+    env = environment()
+    prev = lastrecords(args.history)
+    records = []
+    print('%-20s %8s %8s %8s %8s %7s %7s %5s %9s' % ('variant', 'load s', 'rhs us',
+          'solve s', 'rss MB', 'nst', 'nfe', 'nje', 'D17_O2t'))
+    for name in args.variants:
+        rec = dict(env, **runisolated(name, args.repeat))
+        records.append(rec)
+        print('%-20s %8.3f %8.1f %8.3f %8.1f %7d %7d %5d %9.4f' % (name, rec['load_s'],
+              rec['rhs_us'], rec['solve_s'], rec['peak_rss_mb'], rec['nst'],
+              rec['nfe'], rec['nje'], rec['D17_O2t']))
+        if name in prev:
+            for note in compare(rec, prev[name], args.tol, args.worktol):
+                print('    regression since %s: %s' % (prev[name].get('commit'), note))
+    if not args.no_record:
+        record(records, args.history)
+    return records;
+
+if __name__ == '__main__':
+    main()
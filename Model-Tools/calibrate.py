@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 05:28:37 2026
+
+@author: david
+"""
+
+#%% Load packages
+import io
+import os
+import time
+import argparse
+import contextlib
+import warnings
+import numpy as np
+import pandas as pd
+from scipy import stats
+from modelload import root, variants, cells, loadmodel, outputs
+from newton import invariants, nearby, ptc
+from grid import models
+from uncertainty import distribution, draw, summary
+from sensitivity import factors
+from emulate import train, emulate
+
+#%% Observations
+
+# Slope of the D'17 of the observations (lm of isocompCO2.py)
+lm = 0.528
+
+# Summaries of the CO2 observations that isocompCO2.py collates, as primed
+# deltas against VSMOW: tropospheric averages of Liang2017, BarkanLuz2012
+# and Thiemens2013, and stratospheric averages of Wiegel2013 weighted by
+# number density
+observed = ['d18_CO2t', 'd17_CO2t', 'D17_CO2t', 'd18_CO2s', 'd17_CO2s', 'D17_CO2s']
+
+# Series of isocompCO2.py whose spread is taken as the uncertainty of each
+# summary: the combined tropospheric data and the Wiegel2013 profile
+spreads = {'d18_CO2t': 'dp18Otall', 'd17_CO2t': 'dp17Otall', 'D17_CO2t': 'Dp17tall',
+           'd18_CO2s': 'dp18OW', 'd17_CO2s': 'dp17OW', 'D17_CO2s': 'Dp17W'}
+
+# The script collating the observations
+script = os.path.join(root, 'Calculations', 'isocompCO2', 'isocompCO2.py')
+
+# Summaries and their standard deviations from isocompCO2.py, running its
+# cells from the data to the collated estimates in its own folder (it
+# reads NOAA1976.xlsx, CO2s.xlsx and CO2t.xlsx from there, and needs what
+# the script needs to read them). The plotting packages are not loaded.
+def summaries(path = script):
+    with open(path, encoding = 'utf-8') as file:
+        src = file.read()
+    keep = [cell for cell in cells(src) if not cell.startswith(('#%% Load packages', '#%% xJ'))]
+    ns = {'np': np, 'pd': pd, 'stats': stats}
+    here = os.getcwd()
+    os.chdir(os.path.dirname(os.path.abspath(path)))
+    try:
+        with warnings.catch_warnings(), contextlib.redirect_stdout(io.StringIO()):
+            warnings.simplefilter('ignore')
+            exec(compile('\n'.join(keep), path, 'exec'), ns)
+    finally:
+        os.chdir(here)
+    return pd.DataFrame({'value': ns['isocompCO2'][0].astype(float),
+                         'sd': [np.std(ns[spreads[o]], ddof = 1) for o in observed]}, index = observed);
+
+# Observations to calibrate against (output: value and sd, one row per
+# output): the summaries of isocompCO2.py, a CSV file of the same columns
+# indexed by output, or none (path None), with any given as keyword
+# arguments (output = (value, sd)) added or replacing them
+def observations(path = script, **given):
+    if path is None:
+        table = pd.DataFrame(columns = ['value', 'sd'], dtype = float)
+    elif path.endswith('.py'):
+        table = summaries(path)
+    else:
+        table = pd.read_csv(path, index_col = 0)[['value', 'sd']]
+    for output, (value, sd) in given.items():
+        table.loc[output] = [float(value), float(sd)]
+    return table;
+
+#%% Posterior
+
+# Parameters calibrated by default, if the variant's script sets them: the
+# MIF of ozone formation, the stratosphere-troposphere mixing rate, the
+# O(1D) + CO2 quenching factor and the CO2-H2O exchange of the hydrosphere
+# (grid.knobs), with the ranges of sensitivity.factors as priors
+calibrated = ['KMIF', 'k41', 'TNF', 'kCO2H2O']
+
+# Outputs a likelihood of the observations needs from the model: the
+# observed outputs, and the d18 of every observed D17, which takes the
+# model's D17 (on the slope tequil, or twater in Young2014) to lm
+def needed(obs):
+    return list(obs) + ['d18_' + o[4:] for o in obs
+                        if o.startswith('D17_') and 'd18_' + o[4:] not in obs];
+
+# Model outputs (rows of values, columns in the order of needed) on the
+# observations' slope: every D17 plus shift (the model's slope less lm, one
+# per row or one for all) times its d18. With variances for values and the
+# square of shift, the variances of the D17 on the new slope.
+def reframe(values, columns, shift):
+    values = np.array(values, dtype = float)
+    for i, o in enumerate(columns):
+        if o.startswith('D17_') and 'd18_' + o[4:] in columns:
+            values[:, i] += shift * values[:, columns.index('d18_' + o[4:])]
+    return values;
+
+# Log posterior (up to a constant) of points of the parameters of dists
+# for a variant against obs: the priors of dists, and independent normal
+# errors of the observed outputs with the variance of the observation and,
+# for an emulator, its own. The outputs come from
+#   'emulator': an emulator trained over the range of the priors until its
+#               standard deviation is a tenth of every observation's
+#               (emulate.train; runs through cache, a CSV file)
+#   'model':    steady state solves warm started from the state of the
+#               chain's current point, reusing its factorisation
+#               (newton.nearby), so a step costs a model load, a few chord
+#               iterations and the output cells
+# Returns the function logpost(X, states) of the points X (rows) and the
+# states held by their chains (None for none), giving the log posterior and
+# the states at X, and the emulator (None for the model).
+def posterior(name, obs, dists, mode = 'emulator', cache = None, maxruns = 200, seed = 0, **params):
+    names = list(dists)
+    obs = obs[np.isfinite(obs['sd'])]
+    columns = needed(list(obs.index))
+    pick = [columns.index(o) for o in obs.index]
+    value, var = obs['value'].values, obs['sd'].values ** 2
+    priors = [distribution(spec) for spec in dists.values()]
+    ns = loadmodel(name, **params)
+    slopename = 'tequil' if 'tequil' in ns else 'twater'
+    slopeat = lambda X: X[:, names.index(slopename)] if slopename in names else float(ns[slopename])
+
+    def logprior(X):
+        return sum(prior.logpdf(X[:, i]) for i, prior in enumerate(priors));
+
+    def loglike(mean, extra):
+        s2 = var + extra
+        return -0.5 * (((mean - value) ** 2 / s2) + np.log(2 * np.pi * s2)).sum(axis = 1);
+
+    if mode == 'emulator':
+        low = [prior.ppf(1e-6) if not np.isfinite(prior.support()[0]) else prior.support()[0] for prior in priors]
+        high = [prior.ppf(1 - 1e-6) if not np.isfinite(prior.support()[1]) else prior.support()[1] for prior in priors]
+        em = train(name, dict(zip(names, zip(low, high))), columns, cache, seed = seed, maxruns = maxruns,
+                   aims = {o: sd / 10 for o, sd in obs['sd'].items()}, **params)[0]
+
+        def logpost(X, states):
+            lp = logprior(X)
+            ok = np.isfinite(lp)
+            if ok.any():
+                mean, std = emulate(em, X[ok])
+                shift = slopeat(X[ok]) - lm
+                lp[ok] += loglike(reframe(mean, columns, shift)[:, pick],
+                                  reframe(std ** 2, columns, shift ** 2)[:, pick])
+            return lp, states;
+        return logpost, em;
+
+    C = invariants(ns)
+
+    def logpost(X, states):
+        lp, new = logprior(X), list(states)
+        for c in np.flatnonzero(np.isfinite(lp)):
+            point = dict(zip(names, X[c]))
+            model = next(models(name, [point], params))
+            y, fac = states[c] if states[c] is not None else (None, None)
+            y, fac, row = nearby(model, y, fac, C)
+            if not row['success']:
+                lp[c] = -np.inf
+                continue
+            out = pd.concat(outputs(model, y), axis = 1).iloc[0][columns].values[None, :]
+            lp[c] += loglike(reframe(out, columns, slopeat(X[[c]]) - lm)[:, pick], 0.0)[0]
+            new[c] = (y, fac)
+        return lp, new;
+    return logpost, None;
+
+#%% Sampling
+
+# Adaptive Metropolis (Haario 2001) for chains started at the rows of x0,
+# stepped together so that every step evaluates logpost (see posterior)
+# once for all of them. Proposals are normal, at first with standard
+# deviations a tenth of scale; over the burn in the proposal covariance is
+# taken every adapt steps from the second half of the points so far, of all
+# chains, times 2.38^2 / d, and it is held fixed after. Returns the points
+# after burn in (one row per chain and step), with the log posterior, and in
+# attrs the acceptance rate and time per step after burn in, and the
+# proposal covariance.
+def sample(logpost, x0, scale, steps = 100000, burn = None, adapt = 100, seed = 0):
+    rng = np.random.default_rng(seed)
+    x = np.array(x0, dtype = float)
+    k, d = x.shape
+    burn = steps // 10 if burn is None else burn
+    lp, states = logpost(x, [None] * k)
+    cov = np.diag((np.asarray(scale, dtype = float) / 10) ** 2)
+    L = np.linalg.cholesky(cov)
+    trace, lps = np.empty((burn + steps, k, d)), np.empty((burn + steps, k))
+    accepted = 0
+    t0 = time.perf_counter()
+    for i in range(burn + steps):
+        if i == burn:
+            t0, accepted = time.perf_counter(), 0
+        new = x + rng.standard_normal((k, d)) @ L.T
+        lpnew, statesnew = logpost(new, states)
+        take = np.log(rng.random(k)) < lpnew - lp
+        x[take], lp[take] = new[take], lpnew[take]
+        states = [statesnew[c] if take[c] else states[c] for c in range(k)]
+        accepted += take.sum()
+        trace[i], lps[i] = x, lp
+        if i < burn and i >= 2 * adapt and i % adapt == 0:
+            past = trace[i // 2:i + 1].reshape(-1, d)
+            cov = 2.38 ** 2 / d * np.cov(past, rowvar = False) + 1e-12 * np.diag(np.square(scale))
+            L = np.linalg.cholesky(cov.reshape(d, d))
+    wall = time.perf_counter() - t0
+    table = pd.DataFrame(trace[burn:].reshape(-1, d))
+    table['chain'] = np.tile(np.arange(k), steps)
+    table['step'] = np.repeat(np.arange(steps), k)
+    table['logpost'] = lps[burn:].ravel()
+    table.attrs = {'acceptance': accepted / (steps * k), 'step_s': wall / steps, 'wall_s': wall,
+                   'cov': cov}
+    return table;
+
+# Split R-hat (Gelman 2013) and effective sample size (autocorrelation
+# summed to its first negative value, over the chains) of every parameter
+def diagnostics(table, names):
+    rows = {}
+    for p in names:
+        x = table.pivot(index = 'step', columns = 'chain', values = p).values
+        n = len(x) // 2
+        halves = np.hstack([x[:n], x[n:2 * n]])
+        W = halves.var(axis = 0, ddof = 1).mean()
+        B = n * halves.mean(axis = 0).var(ddof = 1)
+        y = x - x.mean(axis = 0)
+        f = np.fft.rfft(y, 2 * len(y), axis = 0)
+        acf = np.fft.irfft(f * f.conj(), axis = 0)[:len(y)]
+        rho = (acf / np.maximum(acf[0], 1e-300)).mean(axis = 1)
+        cut = np.argmax(rho < 0) if (rho < 0).any() else len(rho)
+        rows[p] = {'rhat': np.sqrt(((n - 1) / n * W + B / n) / W) if W > 0 else np.nan,
+                   'ess': x.size / max(1 + 2 * rho[1:cut].sum(), 1.0)}
+    return pd.DataFrame(rows).T;
+
+#%% Calibration
+
+# Posterior of parameters of a variant (dists, name: prior spec as
+# uncertainty.priors; calibrated with the priors of sensitivity.factors by
+# default) given observations obs (see observations), from chains of steps
+# points after burn in, started at Sobol draws from the priors. mode and the
+# keyword arguments are as posterior. Returns the chain table (see sample),
+# with the number of model runs behind the emulator in attrs, and the
+# emulator.
+def calibrate(name, obs, dists = None, mode = 'emulator', steps = 100000, chains = 4, burn = None,
+              seed = 0, cache = None, maxruns = 200, **params):
+    dists = factors(name, calibrated) if dists is None else dists
+    names = list(dists)
+    t0 = time.perf_counter()
+    logpost, em = posterior(name, obs, dists, mode, cache, maxruns, seed, **params)
+    setup = time.perf_counter() - t0
+    scale = [distribution(spec).std() for spec in dists.values()]
+    table = sample(logpost, draw(dists, chains, seed = seed).values[:chains], scale, steps, burn, seed = seed)
+    table = table.rename(columns = dict(enumerate(names)))
+    table.attrs.update({'setup_s': setup, 'runs': em['runs'] if em else 0, 'mode': mode})
+    return table, em;
+
+#%% Run from the command line
+
+# MCMC calibration of a variant against the isocompCO2.py summaries, a CSV
+# file of observations, or given values, e.g.
+#     python calibrate.py Y14WB2 --steps 100000 --obs D17_CO2t -0.17 0.05
+# With --synthetic, the observations are the variant's own outputs at its
+# script values (or --truth), with the standard deviations given, to check
+# that the chains recover them. Prints the posterior, the chain diagnostics
+# and, for the emulator, the model against the emulator at the posterior
+# mean.
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'MCMC calibration against observations')
+    parser.add_argument('variant', nargs = '?', default = 'Y14WB2', choices = list(variants))
+    parser.add_argument('--params', nargs = '+', default = calibrated)
+    parser.add_argument('--observations', default = None,
+                        help = 'isocompCO2.py (the default) or a CSV file of output, value, sd')
+    parser.add_argument('--obs', nargs = 3, action = 'append', default = [],
+                        metavar = ('OUTPUT', 'VALUE', 'SD'))
+    parser.add_argument('--synthetic', nargs = 2, action = 'append', default = [],
+                        metavar = ('OUTPUT', 'SD'))
+    parser.add_argument('--truth', nargs = 2, action = 'append', default = [],
+                        metavar = ('NAME', 'VALUE'))
+    parser.add_argument('--mode', default = 'emulator', choices = ['emulator', 'model'])
+    parser.add_argument('--steps', type = int, default = 100000)
+    parser.add_argument('--chains', type = int, default = 4)
+    parser.add_argument('--cache', default = None, help = 'CSV file of the emulator runs')
+    parser.add_argument('--out', default = None, help = 'CSV file for the chains')
+    args = parser.parse_args(argv)
+
+    ns = loadmodel(args.variant)
+    dists = factors(args.variant, args.params)
+    given = {o: (v, sd) for o, v, sd in args.obs}
+    if args.synthetic:
+        truth = {p: float(ns[p]) if p in ns else 1.0 for p in dists}
+        truth.update({p: float(v) for p, v in args.truth})
+        model = next(models(args.variant, [truth]))
+        out = pd.concat(outputs(model, ptc(model)[0]), axis = 1).iloc[0]
+        columns = needed([o for o, sd in args.synthetic])
+        values = reframe(out[columns].values[None, :], columns,
+                         truth.get('tequil', float(model.get('tequil', model.get('twater')))) - lm)[0]
+        given.update({o: (values[columns.index(o)], sd) for o, sd in args.synthetic})
+        print('truth: %s' % ', '.join('%s = %.6g' % item for item in truth.items()))
+    path = args.observations or (None if given else script)
+    try:
+        obs = observations(path, **given)
+    except (OSError, ImportError, AttributeError) as error:
+        parser.error('cannot read the observations from %s (%s: %s); give a CSV file of output, '
+                     'value, sd with --observations, or values with --obs' % (path,
+                     type(error).__name__, error))
+    print(obs.to_string(float_format = '%.4f'))
+
+    table, em = calibrate(args.variant, obs, dists, args.mode, args.steps, args.chains, cache = args.cache)
+    names = list(dists)
+    print('%s, %s: %d chains of %d steps after burn in, %.1f s (%.0f us a step), acceptance %.2f, '
+          'set up %.1f s%s' % (args.variant, args.mode, args.chains, args.steps, table.attrs['wall_s'],
+          1e6 * table.attrs['step_s'], table.attrs['acceptance'], table.attrs['setup_s'],
+          ' (%d model runs)' % table.attrs['runs'] if em else ''))
+    print(pd.concat([summary(table, names), diagnostics(table, names)], axis = 1).to_string(float_format = '%.5g'))
+    if em:
+        mean = table[names].mean()
+        model = next(models(args.variant, [mean.to_dict()]))
+        out = pd.concat(outputs(model, ptc(model)[0]), axis = 1).iloc[0]
+        columns = list(em['outputs'])
+        got, std = emulate(em, mean.values)
+        print(pd.DataFrame({'model': out[columns], 'emulator': got[0], 'emulator sd': std[0]},
+                           index = columns).to_string(float_format = '%.5f'))
+    if args.out:
+        table.to_csv(args.out, index = False)
+    return table;
+
+if __name__ == '__main__':
+    main()
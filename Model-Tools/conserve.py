@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 23:06:51 2026
+
+@author: david
+"""
+
+#%% Load packages
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from modelload import variants, loadmodel, outputs
+from solve import steady, integrate, constant
+from newton import invariants
+import transient
+
+#%% Reduced state
+
+# Species left out of the integrated state of a model started from y0: the
+# constant reservoirs (the biosphere O2b, OQb, OXb), which keep their moles
+# from y0, and one species for every conserved quantity (total carbon),
+# worked out from the total of y0 and the other species. The species taken
+# for a conserved quantity is its largest term at y0 (CO2t for carbon), so
+# it is the difference of a large total and small parts and loses nothing
+# to cancellation. keep marks the species that are integrated.
+def reduction(ns, y0 = None, C = None):
+    y0 = np.asarray(ns['y0'] if y0 is None else y0, dtype = float)
+    C = invariants(ns) if C is None else C
+    fixed = constant(ns, y0)
+    pivots = []
+    for c in C:
+        weight = np.abs(c) * np.maximum(np.abs(y0), 1.0)
+        weight[pivots] = 0
+        pivots.append(int(weight.argmax()))
+    keep = ~fixed
+    keep[pivots] = False
+    pivots = np.array(pivots, dtype = int)
+    return {'keep': keep, 'fixed': fixed, 'pivots': pivots, 'y0': y0,
+            'total': C @ y0, 'B': C[:, keep],
+            'Ainv': np.linalg.inv(C[:, pivots]) if len(C) else np.zeros((0, 0))};
+
+# Full states (one per row) from reduced states x
+def expand(red, x):
+    x = np.atleast_2d(x)
+    y = np.tile(red['y0'], (len(x), 1))
+    y[:, red['keep']] = x
+    y[:, red['pivots']] = (red['total'][None, :] - x @ red['B'].T) @ red['Ainv'].T
+    return y;
+
+# f of the reduced state (species by index, which is quicker than a mask
+# at this size)
+def reducedf(red, f):
+    y, keep, pivots = red['y0'].copy(), np.where(red['keep'])[0], red['pivots']
+    B, Ainv, total = red['B'], red['Ainv'], red['total']
+
+    def g(x, t):
+        y[keep] = x
+        y[pivots] = Ainv @ (total - B @ x)
+        return f(y, t)[keep];
+    return g;
+
+# Loaded model in its reduced state: f, y0, moleso and the target moles
+# of the integrated species only, so it can be handed to the solvers as is
+def reducedmodel(ns, red):
+    keep = red['keep']
+    return dict(ns, f = reducedf(red, ns['f']), y0 = red['y0'][keep],
+                moleso = np.asarray(ns['moleso'])[keep], molest = ns['molest'][keep]);
+
+#%% Solving in the reduced state
+
+# Integrate ns from y0 over the times t in the reduced state and return the
+# full states at t; keyword arguments go to solve.integrate
+def run(ns, y0, t, red = None, **kwargs):
+    red = reduction(ns, y0) if red is None else red
+    x, info = integrate(reducedf(red, ns['f']), red['y0'][red['keep']], t, **kwargs)
+    info['nstate'] = int(red['keep'].sum())
+    return expand(red, x), info;
+
+# Steady state of ns solved in the reduced state; keyword arguments go to
+# solve.steady, and info['tconv'] only holds the integrated species
+def reducedsteady(ns, y0 = None, red = None, **kwargs):
+    red = reduction(ns, y0) if red is None else red
+    x, info = steady(reducedmodel(ns, red), **kwargs)
+    info['nstate'] = int(red['keep'].sum())
+    return expand(red, x)[0], info;
+
+#%% Run from the command line
+
+# Steady solves of every variant and the transient scenarios, full state
+# against reduced state
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Conserved quantity and constant reservoir reduction of the model state')
+    parser.add_argument('variants', nargs = '*', default = list(variants))
+    parser.add_argument('--rtol', type = float, default = None)
+    args = parser.parse_args(argv)
+
+    rows = []
+    for name in args.variants:
+        ns = loadmodel(name)
+        t0 = time.perf_counter()
+        red = reduction(ns)
+        setup = time.perf_counter() - t0
+        names = np.asarray(ns['moleso'])
+        print('%s: %d of %d species integrated, constant %s, from totals %s (%.2f s)' % (name,
+              red['keep'].sum(), len(names), ', '.join(names[red['fixed']]),
+              ', '.join(names[red['pivots']]), setup))
+        y, info = steady(ns, rtol = args.rtol, atol = args.rtol)
+        yr, infor = reducedsteady(ns, red = red, rtol = args.rtol, atol = args.rtol)
+        iso = outputs(ns, np.vstack([y, yr]))[0]
+        rows.append({'run': name, 'nfe': info['nfe'], 'nfe_reduced': infor['nfe'],
+                     'nje': info['nje'], 'nje_reduced': infor['nje'],
+                     'wall_s': info['wall_s'], 'wall_reduced_s': infor['wall_s'],
+                     'isodiff': np.nanmax(np.abs(iso.iloc[0] - iso.iloc[1]))})
+    for name, make in transient.scenarios.items():
+        scenario = make()
+        ns = scenario['ns']
+        y, info = transient.reference(scenario)
+        t0 = time.perf_counter()
+        yr, infor = run(ns, scenario['y0'], scenario['t'], h0 = transient.h0)
+        infor['wall_s'] = time.perf_counter() - t0
+        iso = outputs(ns, np.vstack([y[-1], yr[-1]]))[0]
+        rows.append({'run': name, 'nfe': info['nfe'], 'nfe_reduced': infor['nfe'],
+                     'nje': info['nje'], 'nje_reduced': infor['nje'],
+                     'wall_s': info['wall_s'], 'wall_reduced_s': infor['wall_s'],
+                     'isodiff': np.nanmax(np.abs(iso.iloc[0] - iso.iloc[1]))})
+    table = pd.DataFrame(rows)
+    print(table.to_string(index = False))
+    return table;
+
+if __name__ == '__main__':
+    main()
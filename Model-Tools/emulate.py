@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 01:47:09 2026
+
+@author: david
+"""
+
+#%% Load packages
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from scipy.linalg import solve_triangular
+from scipy.optimize import minimize
+from scipy.stats import qmc
+from modelload import variants, loadmodel
+from newton import invariants
+from adapt import solveat
+from uncertainty import readcache, writecache
+
+#%% Parameter space
+
+# Ranges of the theta parameters (the contour plots of Young2014xplots.py
+# span 0.505 to 0.530) and of the terrestrial fraction of production.
+# Young2014 has no tequil; its twater is the same CO2-H2O equilibration
+# theta. Y14WB2 sets the respiration theta as tGA rather than tresp (as
+# tga.solve reads it). Only the parameters a variant's script sets are used.
+box = {'tresp': (0.505, 0.530), 'tGA': (0.505, 0.530), 'tevap': (0.505, 0.530),
+       'tequil': (0.505, 0.530), 'twater': (0.505, 0.530), 'tphoto': (0.505, 0.530),
+       'ft': (0.3, 0.9)}
+
+# Outputs emulated by default
+emulated = ['D17_O2t', 'd18_O2t', 'xJ']
+
+# Emulator standard deviation aimed for when runs are requested: per mil
+# for the isotopes, and for xJ (per mil mol/yr, about 1e16) 1e-4 of it
+target = {'D17_O2t': 1e-3, 'd18_O2t': 1e-2, 'xJ': 1e12}
+
+# Ranges of box that a variant's script sets
+def thetas(name):
+    ns = loadmodel(name)
+    return {param: span for param, span in box.items() if param in ns};
+
+#%% Cached runs
+
+# Steady state outputs at the points of a DataFrame of parameters (one
+# column per parameter, one row per point). Runs are cached in a CSV file
+# (parameters then outputs, one row per run): points already there are read
+# back, the others are solved, each warm started from the nearest point
+# solved in this call, and added to it. A cache of another variant, other
+# fixed parameters or other parameters varied raises ValueError (see
+# uncertainty.readcache). Returns the outputs and the number of points
+# solved.
+def runs(name, points, cache = None, **params):
+    names = list(points.columns)
+    key = lambda values: [tuple(row) for row in np.round(values, 12)]
+    table = readcache(cache, name, names, params)
+    table = pd.DataFrame(columns = names) if table is None else table
+    found = dict(zip(key(table[names].values.astype(float)), range(len(table))))
+    todo = [point for point, k in zip(points[names].values, key(points[names].values)) if k not in found]
+    if todo:
+        solved, new = {}, []
+        spans = [box.get(p, (0, 1))[1] - box.get(p, (0, 1))[0] for p in names]
+        C = invariants(loadmodel(name, **params))
+        for point in todo:
+            point = dict(zip(names, point))
+            solveat(name, point, solved, C, spans, params)
+            new.append(dict(point, **solved[tuple(point.values())]['outputs']))
+        table = pd.concat([table, pd.DataFrame(new)], ignore_index = True) if len(table) else pd.DataFrame(new)
+        if cache is not None:
+            writecache(cache, table, name, names, params, [c for c in table.columns if c not in names])
+        found = dict(zip(key(table[names].values.astype(float)), range(len(table))))
+    rows = [found[k] for k in key(points[names].values)]
+    return table.iloc[rows].reset_index(drop = True), len(todo);
+
+#%% Gaussian process
+
+# Squared exponential covariance of points u (rows, in units of the box)
+# and v with length scales ls
+def kernel(u, v, ls, s2):
+    d = (u[:, None, :] - v[None, :, :]) / ls
+    return s2 * np.exp(-0.5 * (d ** 2).sum(axis = 2));
+
+# Mean functions: a constant and a slope in every parameter, as the linear
+# fits of Young2014xplots.py
+def basis(u):
+    return np.column_stack([np.ones(len(u)), u]);
+
+# Negative restricted log likelihood of the outputs y at u for log length
+# scales, log signal variance and log noise variance in theta; the linear
+# mean is integrated out (generalised least squares)
+def nll(theta, u, y):
+    ls, s2, noise = np.exp(theta[:-2]), np.exp(theta[-2]), np.exp(theta[-1])
+    K = kernel(u, u, ls, s2) + (noise + 1e-10 * s2) * np.eye(len(u))
+    try:
+        L = np.linalg.cholesky(K)
+    except np.linalg.LinAlgError:
+        return 1e10
+    A = solve_triangular(L, basis(u), lower = True)
+    b = solve_triangular(L, y, lower = True)
+    beta = np.linalg.lstsq(A, b, rcond = None)[0]
+    r = b - A @ beta
+    return 0.5 * r @ r + np.log(np.diag(L)).sum() + 0.5 * np.linalg.slogdet(A.T @ A)[1];
+
+# Gaussian process of one output over points u, hyperparameters by
+# maximising the restricted likelihood from a few starts
+def fitgp(u, y):
+    mean, scale = y.mean(), y.std() or 1.0
+    y = (y - mean) / scale
+    d = u.shape[1]
+    best = None
+    for start in [0.3, 1.0, 3.0]:
+        theta0 = np.r_[np.full(d, np.log(start)), 0.0, np.log(1e-6)]
+        bounds = [(np.log(0.02), np.log(100))] * d + [(np.log(1e-4), np.log(1e2)), (np.log(1e-12), np.log(1e-1))]
+        res = minimize(nll, theta0, args = (u, y), method = 'L-BFGS-B', bounds = bounds)
+        if best is None or res.fun < best.fun:
+            best = res
+    ls, s2, noise = np.exp(best.x[:-2]), np.exp(best.x[-2]), np.exp(best.x[-1])
+    K = kernel(u, u, ls, s2) + (noise + 1e-10 * s2) * np.eye(len(u))
+    L = np.linalg.cholesky(K)
+    A = solve_triangular(L, basis(u), lower = True)
+    b = solve_triangular(L, y, lower = True)
+    beta = np.linalg.lstsq(A, b, rcond = None)[0]
+    return {'ls': ls, 's2': s2, 'noise': noise, 'u': u, 'beta': beta, 'A': A,
+            'alpha': solve_triangular(L.T, b - A @ beta, lower = False),
+            'LinvT': solve_triangular(L, np.eye(len(u)), lower = True).T,
+            'G': np.linalg.inv(A.T @ A), 'mean': mean, 'scale': scale};
+
+# Mean and standard deviation of one output at points u, the variance
+# including that of the linear mean. Everything that does not depend on u
+# is kept from the fit, so a batch costs a few matrix products.
+def predictgp(gp, u):
+    k = kernel(u, gp['u'], gp['ls'], gp['s2'])
+    H = basis(u)
+    mu = H @ gp['beta'] + k @ gp['alpha']
+    v = k @ gp['LinvT']
+    R = H - v @ gp['A']
+    var = gp['s2'] - (v ** 2).sum(axis = 1) + ((R @ gp['G']) * R).sum(axis = 1)
+    return gp['mean'] + gp['scale'] * mu, gp['scale'] * np.sqrt(np.maximum(var, 0));
+
+#%% Emulator
+
+# Emulator of the outputs of a variant over a box of parameters (name:
+# (low, high)) from a table of runs (parameters and outputs, see runs)
+def fit(table, space, outputs = emulated):
+    names = list(space)
+    low, high = np.array([space[p] for p in names]).T
+    u = (table[names].values - low) / (high - low)
+    return {'space': dict(space), 'outputs': list(outputs), 'low': low, 'high': high,
+            'n': len(table), 'gp': {output: fitgp(u, table[output].values.astype(float))
+                                    for output in outputs}};
+
+# Emulated outputs and their standard deviations at points x (rows, the
+# parameters in the order of em['space']), as two arrays with one column
+# per output
+def emulate(em, x):
+    u = (np.atleast_2d(x) - em['low']) / (em['high'] - em['low'])
+    mean, std = zip(*[predictgp(em['gp'][output], u) for output in em['outputs']])
+    return np.column_stack(mean), np.column_stack(std);
+
+# emulate for points given as a DataFrame of the parameters, or a dict of
+# values or arrays that broadcast. Returns two DataFrames, the means and the
+# standard deviations.
+def predict(em, points):
+    names = list(em['space'])
+    if not isinstance(points, pd.DataFrame):
+        points = pd.DataFrame(dict(zip(names, np.broadcast_arrays(*[np.atleast_1d(points[p])
+                                                                    for p in names]))))
+    mean, std = emulate(em, points[names].values)
+    return (pd.DataFrame(mean, index = points.index, columns = em['outputs']),
+            pd.DataFrame(std, index = points.index, columns = em['outputs']));
+
+# Emulator built up from as few model runs as it takes: a Latin hypercube of
+# start points, then in every round the batch candidates (from a Sobol
+# sequence over the box) where the emulator's standard deviation, in units
+# of target, is largest, each at least apart (in units of the box) from
+# the others, until it is below one everywhere or maxruns are used. Runs go
+# through the cache (see runs). aims (output: standard deviation) replaces
+# target for the outputs it names. Returns the emulator and the table of
+# runs.
+def train(name, space = None, outputs = emulated, cache = None, start = None, batch = 4,
+          maxruns = 200, candidates = 2048, apart = 0.1, seed = 0, aims = {}, **params):
+    space = thetas(name) if space is None else space
+    names = list(space)
+    low, high = np.array([space[p] for p in names]).T
+    aims = np.array([aims.get(output, target.get(output, 1.0)) for output in outputs])
+    start = 4 * len(names) + 2 if start is None else start
+    points = pd.DataFrame(qmc.scale(qmc.LatinHypercube(len(names), seed = seed).random(start), low, high),
+                          columns = names)
+    table, nrun = runs(name, points, cache, **params)
+    grid = qmc.Sobol(len(names), seed = seed).random(candidates)
+    while True:
+        em = fit(table, space, outputs)
+        std = emulate(em, low + grid * (high - low))[1] / aims
+        worst = std.max(axis = 1)
+        em['error'] = worst.max()
+        if worst.max() < 1 or len(table) >= maxruns:
+            break
+        picks = []
+        for i in np.argsort(worst)[::-1]:
+            if worst[i] < 1 or len(picks) == min(batch, maxruns - len(table)):
+                break
+            if all(np.sqrt(((grid[i] - grid[j]) ** 2).sum()) > apart for j in picks):
+                picks.append(i)
+        more, n = runs(name, pd.DataFrame(low + grid[picks] * (high - low), columns = names),
+                       cache, **params)
+        table = pd.concat([table, more], ignore_index = True)
+        nrun += n
+    em['runs'] = nrun
+    return em, table;
+
+# Emulated outputs over a plane of two parameters with the others held
+# at fixed values (the middle of the box by default), for contour plots in
+# place of the linear fits of Young2014xplots.py. Returns the axes and the
+# means and standard deviations of every output, shaped as np.meshgrid.
+def surface(em, x, y, num = 50, **fixed):
+    xs = np.linspace(*em['space'][x], num)
+    ys = np.linspace(*em['space'][y], num)
+    X, Y = np.meshgrid(xs, ys)
+    points = {p: np.full(X.size, fixed.get(p, np.mean(span))) for p, span in em['space'].items()}
+    points[x], points[y] = X.ravel(), Y.ravel()
+    mean, std = predict(em, points)
+    return X, Y, {o: mean[o].values.reshape(X.shape) for o in em['outputs']}, \
+        {o: std[o].values.reshape(X.shape) for o in em['outputs']};
+
+#%% Run from the command line
+
+# Train an emulator of a variant over its theta parameters and check it
+# against model runs at random points it was not trained on
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Gaussian process emulator of steady state outputs')
+    parser.add_argument('variant', nargs = '?', default = 'sbmodWB', choices = list(variants))
+    parser.add_argument('--cache', default = None, help = 'CSV file of cached runs')
+    parser.add_argument('--maxruns', type = int, default = 200)
+    parser.add_argument('--check', type = int, default = 50)
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    em, table = train(args.variant, cache = args.cache, maxruns = args.maxruns)
+    print('%s over %s: %d runs (%d solved) in %.1f s, largest standard deviation %.2f of target' % (
+          args.variant, ', '.join(em['space']), len(table), em['runs'], time.perf_counter() - t0, em['error']))
+    for output, gp in em['gp'].items():
+        print('  %s: length scales %s' % (output, np.array2string(gp['ls'], precision = 2)))
+
+    # Speed of predictions, one point at a time and in a batch
+    names = list(em['space'])
+    rng = np.random.default_rng(1)
+    low, high = em['low'], em['high']
+    one = low + rng.random(len(names)) * (high - low)
+    t0 = time.perf_counter()
+    for i in range(200):
+        emulate(em, one)
+    single = (time.perf_counter() - t0) / 200
+    many = low + rng.random((10000, len(names))) * (high - low)
+    t0 = time.perf_counter()
+    emulate(em, many)
+    print('prediction: %.0f us for one point, %.1f us a point in a batch of %d' % (single * 1e6,
+          (time.perf_counter() - t0) / len(many) * 1e6, len(many)))
+
+    # Held out check
+    if args.check:
+        points = pd.DataFrame(low + rng.random((args.check, len(names))) * (high - low), columns = names)
+        truth = runs(args.variant, points)[0]
+        mean, std = predict(em, points)
+        for output in em['outputs']:
+            miss = mean[output] - truth[output]
+            print('  %s: largest error %.2e, rms %.2e, mean predicted sd %.2e, within 2 sd %.0f%%' % (output,
+                  np.abs(miss).max(), np.sqrt((miss ** 2).mean()), std[output].mean(),
+                  100 * (np.abs(miss) <= 2 * std[output]).mean()))
+    return em;
+
+if __name__ == '__main__':
+    main()
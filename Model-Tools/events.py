@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 20:52:18 2026
+
+@author: david
+"""
+
+#%% Load packages
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from scipy.optimize import brentq
+from modelload import outputs
+from solve import steady, steppers, deftol
+from timescales import tres
+import forcing
+import transient
+
+#%% Quantities
+
+# Value of a quantity at each of the states Y (one per row): a species of
+# moleso, or an isotope or fracflux output of the script's post cells. All
+# names are worked out with one call of the post cells, which costs the
+# same for one state as for a few hundred.
+def evaluate(ns, names, Y):
+    Y = np.atleast_2d(Y)
+    index = list(ns['moleso'])
+    values, post = {}, None
+    for name in names:
+        if name in index:
+            values[name] = Y[:, index.index(name)]
+            continue
+        if post is None:
+            post = pd.concat(outputs(ns, Y), axis = 1)
+        values[name] = post[name].values
+    return values;
+
+#%% Events
+
+# An event is a dict: the quantity watched, the level whose crossing fires
+# it, the direction of the crossing (+1 rising, -1 falling, 0 either) and
+# whether the run ends there. Extrema are crossings of zero by the rate of
+# change of the quantity.
+def crossing(quantity, level, direction = 0, terminal = False, name = None):
+    return {'name': name or '%s = %g' % (quantity, level), 'quantity': quantity,
+            'level': float(level), 'direction': direction, 'terminal': terminal,
+            'rate': False};
+
+# Maximum (kind 'max'), minimum ('min') or either ('any') of a quantity
+def extremum(quantity, kind = 'any', terminal = False):
+    direction = {'max': -1, 'min': 1, 'any': 0}[kind]
+    return {'name': '%s %s' % (quantity, 'extremum' if kind == 'any' else kind + 'imum'),
+            'quantity': quantity, 'level': 0.0, 'direction': direction,
+            'terminal': terminal, 'rate': True};
+
+# Time to cover frac of the way from y0 to the steady state yend the model
+# relaxes to (found from y0 when not given)
+def approach(ns, quantity, y0, frac = 0.9, yend = None, terminal = False, name = None):
+    if yend is None:
+        yend = steady(ns, y0 = y0)[0]
+    q0, qend = (evaluate(ns, [quantity], y)[quantity][0] for y in (y0, yend))
+    return crossing(quantity, q0 + frac * (qend - q0), np.sign(qend - q0), terminal,
+                    name or '%g%% of %s' % (100 * frac, quantity));
+
+# e-folding time: the departure from the new steady state down to 1/e
+def efold(ns, quantity, y0, yend = None, terminal = False):
+    return approach(ns, quantity, y0, 1 - np.exp(-1), yend, terminal,
+                    '%s e-folding' % quantity);
+
+# Event functions of the states Y at the times T: the quantity less the
+# level, or for extrema its rate of change along the trajectory, by central
+# differences over a time h either side (a small part of the solver step).
+# With h None the rates are not worked out and their values are NaN.
+def eventvalues(ns, events, T, Y, h):
+    T, Y = np.atleast_1d(T), np.atleast_2d(Y)
+    names = list({event['quantity'] for event in events})
+    values = evaluate(ns, names, Y)
+    if h is not None and any(event['rate'] for event in events):
+        F = np.array([ns['f'](y, t) for t, y in zip(T, Y)]) * np.reshape(h, (-1, 1))
+        ahead = evaluate(ns, names, Y + F)
+        behind = evaluate(ns, names, Y - F)
+    g = np.empty((len(Y), len(events)))
+    for j, event in enumerate(events):
+        name = event['quantity']
+        if event['rate'] and h is None:
+            g[:, j] = np.nan
+        elif event['rate']:
+            g[:, j] = (ahead[name] - behind[name]) / (2 * np.asarray(h))
+        else:
+            g[:, j] = values[name] - event['level']
+    return g;
+
+#%% Integration with events
+
+# Integrate ns from y0 to tend with the LSODA (or another solve_ivp) stepper,
+# watching for events. Event functions are evaluated at the end of every
+# step, batch steps at a time so the post cells run once per batch, and a
+# change of sign is located inside its step by root finding on the step's
+# interpolant. Only the interpolants of the current batch are kept, never
+# the trajectory. Returns a DataFrame of the events that fired (event, t,
+# value of the quantity, and the state), the final state (the state at a
+# terminal event) and the solver work.
+#
+# Extrema are only looked for from tres years after t0: before then the
+# photochemistry is still settling into quasi-equilibrium, and a run from a
+# steady state has rates that are rounding noise.
+def watch(ns, y0, tend, events, method = 'LSODA', rtol = None, atol = None,
+          h0 = transient.h0, batch = 64, t0 = 0.0):
+    rtol = deftol if rtol is None else rtol
+    atol = deftol if atol is None else atol
+    start = time.perf_counter()
+    solver = steppers[method](lambda ti, yi: ns['f'](yi, ti), t0, np.asarray(y0, dtype = float),
+                              tend, rtol = rtol, atol = atol, first_step = h0)
+    direction = np.array([event['direction'] for event in events])
+    rate = np.array([event['rate'] for event in events])
+    gprev = eventvalues(ns, events, t0, y0, None)[0]
+    hits, steps, yend, nsteps = [], [], None, 0
+    while yend is None:
+        if solver.status == 'running':
+            ta = solver.t
+            solver.step()
+            if solver.status == 'failed':
+                break
+            steps.append((ta, solver.t, solver.dense_output()))
+            nsteps += 1
+            if len(steps) < batch and solver.status == 'running':
+                continue
+        if not steps:
+            break
+        T = np.array([tb for ta, tb, dense in steps])
+        Y = np.array([dense(tb) for ta, tb, dense in steps])
+        h = 1e-2 * np.array([tb - ta for ta, tb, dense in steps])
+        G = eventvalues(ns, events, T, Y, h)
+        G[np.ix_(T < t0 + tres, rate)] = np.nan
+        for k, (ta, tb, dense) in enumerate(steps):
+            up = (gprev < 0) & (G[k] >= 0)
+            down = (gprev > 0) & (G[k] <= 0)
+            found = []
+            for j in np.where((up & (direction >= 0)) | (down & (direction <= 0)))[0]:
+                g = lambda s: eventvalues(ns, [events[j]], s, dense(s), h[k])[0, 0]
+                # Rates at the step's ends are recomputed with this step's
+                # h, which can move a crossing right at the end onto it
+                ga, gb = g(ta), g(tb)
+                if ga * gb < 0:
+                    te = brentq(g, ta, tb, xtol = 1e-12 * max(abs(tb), 1))
+                else:
+                    te = ta if ga == 0 else tb
+                name = events[j]['quantity']
+                found.append({'event': events[j]['name'], 't': te,
+                              'value': evaluate(ns, [name], dense(te))[name][0],
+                              'y': dense(te), 'terminal': events[j]['terminal']})
+            for hit in sorted(found, key = lambda hit: hit['t']):
+                hits.append(hit)
+                if hit['terminal']:
+                    yend = hit['y']
+                    break
+            if yend is not None:
+                break
+            gprev = G[k]
+        steps = []
+    info = {'nfe': solver.nfev, 'nje': solver.njev, 'nst': nsteps,
+            'tstop': hits[-1]['t'] if yend is not None else solver.t,
+            'success': solver.status != 'failed',
+            'message': 'Integration successful.' if solver.status != 'failed'
+                       else 'step size became too small',
+            'wall_s': time.perf_counter() - start}
+    if yend is None:
+        yend = solver.y
+    return pd.DataFrame(hits, columns = ['event', 't', 'value', 'y']), yend, info;
+
+#%% Run from the command line
+
+# Times of the same events found by scanning a stored trajectory, as is done
+# today, for comparison: the first output time past each crossing
+def scan(ns, t, y, events):
+    G = eventvalues(ns, events, t, y, np.gradient(t) / 2)
+    rows = []
+    for j, event in enumerate(events):
+        g = np.where(event['rate'] & (t < t[0] + tres), np.nan, G[:, j])
+        up, down = (g[:-1] < 0) & (g[1:] >= 0), (g[:-1] > 0) & (g[1:] <= 0)
+        k = np.where((up & (event['direction'] >= 0)) | (down & (event['direction'] <= 0)))[0]
+        rows += [{'event': event['name'], 't': t[i + 1]} for i in k]
+    return pd.DataFrame(rows, columns = ['event', 't']);
+
+# Milestones of the transient scenarios: 90% of the way to the new steady
+# state of D17_O2t, its e-folding time and its extrema, found during the run
+# and by scanning the stored 0.1 year trajectory; and, for a forced run with
+# CO2 rising 0.5% a year from 280 ppm, the time xCO2t crosses 350 ppm
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Event detection in the transient scenarios')
+    parser.add_argument('--quantity', default = 'D17_O2t')
+    parser.add_argument('--ppm', type = float, default = 350)
+    args = parser.parse_args(argv)
+
+    for name, make in transient.scenarios.items():
+        scenario = make()
+        ns, y0 = scenario['ns'], scenario['y0']
+        yend = steady(ns, y0 = y0)[0]
+        events = [approach(ns, args.quantity, y0, 0.9, yend),
+                  efold(ns, args.quantity, y0, yend), extremum(args.quantity)]
+        hits, y, info = watch(ns, y0, scenario['t'][-1], events)
+        print('%s: %d steps, nfe %d, %.2f s' % (name, info['nst'], info['nfe'], info['wall_s']))
+        t0 = time.perf_counter()
+        yref, ref = transient.reference(scenario)
+        found = scan(ns, scenario['t'], yref, events)
+        print('  stored run and scan %.2f s, %d states' % (time.perf_counter() - t0, len(yref)))
+        for event in events:
+            during = hits.loc[hits['event'] == event['name'], 't'].values
+            after = found.loc[found['event'] == event['name'], 't'].values
+            print('  %-24s during %-28s scan %s' % (event['name'],
+                  np.array2string(during, precision = 3), np.array2string(after, precision = 1)))
+
+    # Forced CO2 rise: ends at the crossing
+    scenario = transient.anthroCO2()
+    ns, ypre = scenario['ns0'], scenario['ypre']
+    index = list(ns['moleso'])
+    x0 = ypre[[index.index(name) for name in ['CO2t', 'COQt', 'COXt']]].sum() / ns['airt']
+    years = np.arange(0, 151)
+    model = forcing.forced(ns, {'xCO2t': forcing.series(years, x0 * 1.005 ** years, 'smooth')})
+    event = crossing('xCO2t', args.ppm * 1e-6, 1, True)
+    hits, y, info = watch(model, ypre, 150, [event])
+    print('xCO2t record: crosses %g ppm at %.4f years (%.4f expected), nfe %d' % (args.ppm,
+          hits['t'].iloc[0], np.log(args.ppm * 1e-6 / x0) / np.log(1.005), info['nfe']))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 13:21:48 2026
+
+@author: david
+"""
+
+#%% Load packages
+import re
+import ast
+import time
+import types
+import timeit
+import argparse
+import numpy as np
+import pandas as pd
+from modelload import readscript, outputs
+from solve import steady
+
+#%% Rate constants used by f
+
+# Stratospheric reactions (K1 - K55) and transport/exchange constants
+# (k12, k21t, kr9m, ...) as they are named in the model scripts
+reaction = re.compile(r'^K\d+$')
+constant = re.compile(r'^(K\d+|k\d+[a-z]?|kr\d+[a-z]?)$')
+
+# Rate constants f reads from the model namespace, reactions first, each
+# group in numerical order
+def terms(ns):
+    names = [name for name in ns['f'].__code__.co_names
+             if constant.match(name) and np.isscalar(ns.get(name))]
+    key = lambda name: (not reaction.match(name), re.sub(r'\d+', '', name),
+                        int(re.search(r'\d+', name).group()), name)
+    return sorted(set(names), key = key);
+
+# Reaction written in the comment of the last assignment of each constant,
+# e.g. 'O2 + O -> O3'
+def labels(ns):
+    src = readscript(ns['variant'], ns['params'])[1]
+    labels = {}
+    for name, label in re.findall(r'^(\w+) = [^#\n]*#\s*(.*)$', src, re.M):
+        labels[name] = re.sub(r'\s*(mol/yr|1/\(yr mol\)|yr\^-1)\s*$', '', label).strip()
+    return labels;
+
+# Copy of f reading its constants from a copy of the namespace with some
+# of them replaced, so the loaded model itself is never changed
+def withvalues(ns, **values):
+    new = dict(ns, **values)
+    new['f'] = types.FunctionType(ns['f'].__code__, new, 'f')
+    return new;
+
+#%% Flux profile
+
+# Contribution of each rate constant to the rate of change of every species
+# at the state y. Every term of f is linear in its rate constant, so the
+# contribution is f(y) less f(y) with that constant set to zero.
+def contributions(ns, y, names = None):
+    if names is None:
+        names = terms(ns)
+    dy = ns['f'](y, 0)
+    rows = [dy - withvalues(ns, **{name: 0})['f'](y, 0) for name in names]
+    return pd.DataFrame(rows, index = names, columns = ns['moleso']);
+
+# Rate of each reaction in mol/yr: K times the stratospheric reactants read
+# from its label (PHO is photolysis and counts as 1). Constants whose label
+# cannot be read are given their largest contribution to any one species.
+def rates(ns, y, contrib):
+    index = {name: i for i, name in enumerate(ns['moleso'])}
+    text = labels(ns)
+    rate = {}
+    for name in contrib.index:
+        lhs = text.get(name, '').split('->')[0].split('+')
+        lhs = [species.strip() for species in lhs if species.strip() != 'PHO']
+        if reaction.match(name) and lhs and all(s + 's' in index for s in lhs):
+            rate[name] = ns[name] * np.prod([y[index[s + 's']] for s in lhs])
+        else:
+            rate[name] = contrib.loc[name].abs().max()
+    return pd.Series(rate);
+
+# Families whose members turn into one another on the fast null cycles
+# (O2 + O -> O3 and O3 + PHO -> O2 + O, and their isotopic partners), so
+# that their budget is made by the slow sources and sinks: odd oxygen, the
+# O, O1D and O3 of every isotope
+families = {'Ox': ['Os', 'O1Ds', 'O3s', 'Qs', 'Q1Ds', 'OOQs', 'Xs', 'X1Ds', 'OOXs']}
+
+# Steady state flux profile of a loaded model. Returns one row per rate
+# constant (label, value, rate, share of the largest budget it enters and
+# the species or family of that budget) and the table of contributions. A
+# budget is the sum of absolute contributions of every term to a species,
+# or to a family after the contributions to its members are added up, so
+# production and loss both count but the null cycles inside a family
+# cancel. A species budget is swamped by its fast cycles (the O budget by
+# O3 photolysis and O2 + O -> O3); the odd oxygen budget is not, and is
+# what gives K1 and the odd oxygen sinks their weight.
+def profile(ns, y = None):
+    if y is None:
+        y = steady(ns)[0]
+    contrib = contributions(ns, y)
+    budgets = contrib.assign(**{name: contrib[members].sum(axis = 1)
+                                for name, members in families.items()
+                                if set(members) <= set(contrib.columns)})
+    gross = budgets.abs().sum()
+    share = budgets.abs() / gross.where(gross > 0)
+    text = labels(ns)
+    table = pd.DataFrame({'label': [text.get(name, '') for name in contrib.index],
+                          'value': [ns[name] for name in contrib.index],
+                          'rate': rates(ns, y, contrib),
+                          'share': share.max(axis = 1).fillna(0),
+                          'species': share.idxmax(axis = 1, skipna = True)},
+                         index = contrib.index)
+    return table, contrib;
+
+#%% Reduced mechanism
+
+# Outputs held by the reduction and their tolerances: per mil for the D17
+# columns, relative for xJ
+tols = {'D17_O2t': 1e-3, 'D17_CO2s': 1e-3, 'xJ': 1e-3}
+
+# Values of the held outputs for a state
+def held(ns, y):
+    isotopes, fracflux = outputs(ns, y)
+    both = pd.concat([isotopes, fracflux], axis = 1).iloc[0]
+    return both[list(tols)];
+
+# Largest deviation of each held output from the reference, over its tolerance
+def deviation(ref, new):
+    dev = {}
+    for key, tol in tols.items():
+        scale = abs(ref[key]) if key == 'xJ' else 1
+        dev[key] = abs(new[key] - ref[key]) / scale / tol
+    return pd.Series(dev);
+
+# Remove terms that multiply a dropped constant from an expression tree
+class Prune(ast.NodeTransformer):
+    def __init__(self, names):
+        self.names = set(names)
+
+    @staticmethod
+    def zero(node):
+        return (isinstance(node, ast.Constant) and not isinstance(node.value, bool)
+                and node.value == 0)
+
+    def visit_Name(self, node):
+        if node.id in self.names and isinstance(node.ctx, ast.Load):
+            return ast.copy_location(ast.Constant(0), node)
+        return node
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        return node.operand if self.zero(node.operand) else node
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        left, right = self.zero(node.left), self.zero(node.right)
+        if isinstance(node.op, ast.Mult) and (left or right):
+            return ast.copy_location(ast.Constant(0), node)
+        if isinstance(node.op, ast.Div) and left:
+            return node.left
+        if isinstance(node.op, (ast.Add, ast.Sub)) and right:
+            return node.left
+        if isinstance(node.op, ast.Add) and left:
+            return node.right
+        if isinstance(node.op, ast.Sub) and left:
+            return ast.copy_location(ast.UnaryOp(ast.USub(), node.right), node)
+        return node
+
+# Loaded model with the dropped reactions removed from f. The terms are
+# taken out of the source of f rather than set to zero, so the reduced f
+# does less work per call.
+def reduced(ns, drop):
+    path, src = readscript(ns['variant'], ns['params'])[:2]
+    tree = ast.parse(src)
+    fdef = next(node for node in tree.body
+                if isinstance(node, ast.FunctionDef) and node.name == 'f')
+    fdef = ast.fix_missing_locations(Prune(drop).visit(fdef))
+    new = dict(ns, **{name: 0 for name in drop})
+    exec(compile(ast.Module([fdef], type_ignores = []), path, 'exec'), new)
+    new['dropped'] = list(drop)
+    return new;
+
+# Best of repeats of the time to steady state from the script's initial
+# state
+def solvetime(ns, repeat = 3):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        steady(ns)
+        times.append(time.perf_counter() - t0)
+    return min(times);
+
+# Drop every reaction whose share of all budgets is below threshold, one at
+# a time from the smallest, keeping a drop only if the steady state still
+# holds the outputs in tols. A reduced model whose f is cheaper can still
+# take the solver longer (a dropped term may have damped a stiff mode), so
+# the reduction is only kept if it solves to steady state faster than the
+# full model; otherwise the full model is returned. Returns the model and a
+# table of the candidates tried, whose attrs hold both solve times.
+def reduce(ns, threshold = 1e-3, y = None, verbose = True):
+    if y is None:
+        y = steady(ns)[0]
+    table = profile(ns, y)[0]
+    ref = held(ns, y)
+    candidates = table[[bool(reaction.match(name)) for name in table.index]]
+    candidates = candidates[candidates['share'] < threshold].sort_values('share')
+    drop, rows = [], []
+    for name in candidates.index:
+        trial = reduced(ns, drop + [name])
+        ytrial, info = steady(trial, y0 = y)
+        dev = deviation(ref, held(trial, ytrial)) if info['success'] else None
+        keep = dev is not None and bool((dev <= 1).all())
+        if keep:
+            drop.append(name)
+        rows.append(dict(name = name, share = candidates.loc[name, 'share'],
+                         dropped = keep, **({} if dev is None else dev.to_dict())))
+        if verbose:
+            print('  %-4s share %.1e  %s' % (name, candidates.loc[name, 'share'],
+                  'dropped' if keep else 'kept'))
+    small = reduced(ns, drop)
+    tried = pd.DataFrame(rows)
+    tried.attrs['solve_s'] = {'full': solvetime(ns), 'reduced': solvetime(small)}
+    faster = tried.attrs['solve_s']['reduced'] < tried.attrs['solve_s']['full']
+    if verbose:
+        print('  steady state in %.3f s full, %.3f s reduced: %s' % (tried.attrs['solve_s']['full'],
+              tried.attrs['solve_s']['reduced'], 'reduction kept' if faster else 'full model kept'))
+    return (small if faster else ns), tried;
+
+#%% Run from the command line
+
+def main(argv = None):
+    from modelload import loadmodel
+    parser = argparse.ArgumentParser(description = 'Steady state flux profile and mechanism reduction')
+    parser.add_argument('variant')
+    parser.add_argument('--threshold', type = float, default = 1e-3,
+                        help = 'largest budget share of a reaction that may be dropped')
+    parser.add_argument('--out', default = None, help = 'write the profile to this csv')
+    args = parser.parse_args(argv)
+
+    ns = loadmodel(args.variant)
+    y = steady(ns)[0]
+    table, contrib = profile(ns, y)
+    if args.out:
+        table.join(contrib).to_csv(args.out)
+    with pd.option_context('display.width', 160, 'display.max_rows', None):
+        print(table.sort_values('share', ascending = False).to_string())
+
+    print('\nReduction at threshold %g:' % args.threshold)
+    small, tried = reduce(ns, args.threshold, y)
+    nrhs = 2000
+    for name, model in [('full', ns), ('reduced', reduced(ns, small.get('dropped', [])))]:
+        trhs = min(timeit.repeat(lambda: model['f'](y, 0), number = nrhs, repeat = 3)) / nrhs
+        ym, info = steady(model)
+        print('%-8s %2d reactions dropped  rhs %5.1f us  solve %.3f s  nfe %5d  %s' % (name,
+              len(model.get('dropped', [])), trhs * 1e6, tried.attrs['solve_s'][name], info['nfe'],
+              '  '.join('%s %.6g' % item for item in held(model, ym).items())))
+    print('dropped:', ' '.join(small.get('dropped', [])) or 'none, the reduction does not solve faster')
+    return small;
+
+if __name__ == '__main__':
+    main()
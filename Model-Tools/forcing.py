@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 19:26:53 2026
+
+@author: david
+"""
+
+#%% Load packages
+import time
+import argparse
+import numpy as np
+from scipy.interpolate import PchipInterpolator
+from modelload import loadmodel, outputs
+from solve import integrate
+import transient
+
+#%% Forcing time series
+
+# A forcing series is a dict of knot times (years), values and how to read
+# between knots: 'linear' interpolation, a 'step' holding each value until
+# the next knot, or 'smooth', a monotone cubic (PCHIP) through the knots
+# whose slope is continuous. Before the first knot and after the last the
+# end values hold.
+#
+# A yearly record read linearly kinks at every knot, and each kink costs
+# the solver a run of small steps; read smoothly it only kinks at its ends.
+def series(t, values, kind = 'linear'):
+    if kind not in ('linear', 'step', 'smooth'):
+        raise ValueError("kind must be 'linear', 'step' or 'smooth'")
+    t, values = np.asarray(t, dtype = float), np.asarray(values, dtype = float)
+    if t.ndim != 1 or t.shape != values.shape or np.any(np.diff(t) <= 0):
+        raise ValueError('forcing times must be increasing and match the values')
+    s = {'t': t, 'v': values, 'kind': kind}
+    if kind == 'smooth':
+        s['p'] = PchipInterpolator(t, values)
+        s['dp'] = s['p'].derivative()
+    return s;
+
+# Ramp from v0 at t0 to v1 at t1
+def ramp(t0, t1, v0, v1):
+    return series([t0, t1], [v0, v1]);
+
+# Jump from v0 to v1 at t0
+def step(t0, v0, v1):
+    return series([t0 - 1, t0], [v0, v1], 'step');
+
+# Value of a series at time t
+def value(s, t):
+    if s['kind'] == 'linear':
+        return np.interp(t, s['t'], s['v'])
+    if s['kind'] == 'smooth':
+        return float(s['p'](min(max(t, s['t'][0]), s['t'][-1])))
+    i = np.searchsorted(s['t'], t, 'right') - 1
+    return s['v'][max(i, 0)];
+
+# Rate of change of a series at time t (zero outside the knots and for steps)
+def slope(s, t):
+    if s['kind'] == 'step' or t < s['t'][0] or t >= s['t'][-1]:
+        return 0.0
+    if s['kind'] == 'smooth':
+        return float(s['dp'](t))
+    i = np.searchsorted(s['t'], t, 'right') - 1
+    return (s['v'][i + 1] - s['v'][i]) / (s['t'][i + 1] - s['t'][i]);
+
+# Forcings the model reads by their rate of change (see forced) rather
+# than their value
+slopes = ['xCO2t']
+
+# Times inside (t0, t1) where the RHS jumps and where it kinks. A forcing
+# read by its value jumps at the knots of a step series and kinks at the
+# knots of a linear series and the ends of a smooth one. One read by its
+# rate of change (slopes) jumps where its slope does: at every knot of a
+# linear series and the ends of a smooth one; a step series of it is
+# handled by resetting the state at its knots (see run), so they are
+# jumps too. The solver is restarted at jumps and stopped without
+# restarting at kinks.
+def breakpoints(forcing, t0, t1):
+    jumps, kinks = [[]], [[]]
+    for name, s in forcing.items():
+        if s['kind'] == 'step':
+            jumps.append(s['t'][1:][np.diff(s['v']) != 0])
+        elif name in slopes:
+            jumps.append(s['t'] if s['kind'] == 'linear' else s['t'][[0, -1]])
+        else:
+            kinks.append(s['t'] if s['kind'] == 'linear' else s['t'][[0, -1]])
+    jumps, kinks = np.unique(np.concatenate(jumps)), np.unique(np.concatenate(kinks))
+    return (jumps[(jumps > t0) & (jumps < t1)],
+            kinks[(kinks > t0) & (kinks < t1)]);
+
+#%% Forced model
+
+# Forcings understood besides script parameters: CO2 emissions into the
+# troposphere or stratosphere in mol/yr (added to the CO2 isotopologue as
+# the transient scripts do), and xCO2t, the tropospheric CO2 mixing ratio
+# the run is made to follow
+emissions = ['CO2t', 'CO2s']
+
+# Constants f reads that depend on a script parameter, as value = c0 + c1 * p.
+# Found by loading the script at other values of the parameter, so derived
+# constants (k21t = ft * k21, ...) follow; they must be affine in it.
+def dependents(ns, name):
+    names = [key for key in ns['f'].__code__.co_names
+             if isinstance(ns.get(key), (int, float)) and not isinstance(ns.get(key), bool)]
+    if name in ns['params']:
+        p0 = float(ns['params'][name])
+    else:
+        p0 = float(loadmodel(ns['variant'], **ns['params'])[name])
+    p1, p2 = (1.5 * p0, 0.5 * p0) if p0 != 0 else (1.0, -1.0)
+    at = [loadmodel(ns['variant'], **dict(ns['params'], **{name: p})) for p in (p0, p1, p2)]
+    affine = {}
+    for key in names:
+        c = [float(model[key]) for model in at]
+        if c[0] == c[1] == c[2]:
+            continue
+        c1 = (c[1] - c[0]) / (p1 - p0)
+        c0 = c[0] - c1 * p0
+        if not np.isclose(c0 + c1 * p2, c[2], rtol = 1e-9, atol = 0):
+            raise ValueError('%s is not affine in %s' % (key, name))
+        affine[key] = (c0, c1)
+    if not affine:
+        raise KeyError('%s does not change any constant f uses' % name)
+    return affine;
+
+# Copy of a loaded model whose f reads the forcings at each call. Keys of
+# forcing are script parameters (k21, ft, ...; the series gives the value of
+# the parameter), emissions, or xCO2t. xCO2t enters f by its slope, so a
+# linear series of it would jump the RHS at every knot, and each jump needs
+# a restart at the photochemical step size (a yearly record costs ~50 times
+# the RHS calls of the same record read smoothly); it must be 'smooth' or
+# 'step', and anything else raises ValueError.
+def forced(ns, forcing):
+    for name in slopes:
+        if name in forcing and forcing[name]['kind'] not in ('smooth', 'step'):
+            raise ValueError("%s enters f by its slope: give it as a 'smooth' or 'step' series" % name)
+    index = list(ns['moleso'])
+    consts = dict(ns)
+    rhs = type(ns['f'])(ns['f'].__code__, consts, 'f')
+    params = [(forcing[name], dependents(ns, name)) for name in forcing
+              if name not in emissions and name != 'xCO2t']
+    sources = [(index.index(name), forcing[name]) for name in emissions if name in forcing]
+    target = forcing.get('xCO2t')
+    trop = [index.index(name) for name in ['CO2t', 'COQt', 'COXt']]
+    airt = ns['airt']
+
+    def f(y, t):
+        for s, affine in params:
+            p = value(s, t)
+            for key, (c0, c1) in affine.items():
+                consts[key] = c0 + c1 * p
+        dy = rhs(y, t)
+        for i, s in sources:
+            dy[i] += value(s, t)
+        if target is not None:
+            # Source that makes total tropospheric CO2 follow the mixing ratio
+            dy[trop[0]] += airt * slope(target, t) - dy[trop].sum()
+        return dy
+
+    new = dict(ns, f = f, forcing = forcing)
+    return new;
+
+# Set tropospheric CO2 to the mixing ratio of xCO2t at time t, changing the
+# CO2 isotopologue only as the transient scripts do
+def setCO2(ns, y, t):
+    index = list(ns['moleso'])
+    y = y.copy()
+    y[index.index('CO2t')] = (ns['airt'] * value(ns['forcing']['xCO2t'], t)
+                              - y[index.index('COQt')] - y[index.index('COXt')])
+    return y;
+
+#%% Forced run
+
+# Integrate a forced model (see forced) over the output times t. The run is
+# restarted at every jump of a forcing, and the solver is stopped at every
+# kink so that no step straddles one; with breaks False it runs straight
+# through for comparison. Returns the states at t and the solver work.
+#
+# Restarts are not used at kinks: every restart begins again at the
+# photochemical step size and costs several hundred RHS calls, while a
+# stop at a kink costs a few steps.
+def run(ns, t, y0 = None, rtol = None, atol = None, breaks = True):
+    t = np.asarray(t, dtype = float)
+    y = np.asarray(ns['y0'] if y0 is None else y0, dtype = float)
+    jumps, kinks = breakpoints(ns['forcing'], t[0], t[-1]) if breaks else ([], [])
+    edges = np.concatenate([[t[0]], jumps, [t[-1]]])
+    out = np.empty((len(t), len(y)))
+    info = {'nfe': 0, 'nje': 0, 'nst': 0, 'segments': 0, 'success': True,
+            'message': 'Integration successful.'}
+    t0 = time.perf_counter()
+    for a, b in zip(edges[:-1], edges[1:]):
+        if 'xCO2t' in ns['forcing']:
+            y = setCO2(ns, y, a)
+        inside = (t > a) & (t < b)
+        ts = np.concatenate([[a], t[inside], [b]])
+        # Each segment runs on its own clock from zero, so the restart's
+        # first steps are not lost against t
+        tcrit = [kink - a for kink in kinks if a < kink < b] or None
+        ys, part = integrate(lambda yi, ti: ns['f'](yi, a + ti), y, ts - a,
+                             rtol = rtol, atol = atol, h0 = transient.h0,
+                             tcrit = tcrit)
+        out[np.searchsorted(t, ts[:-1])] = ys[:-1]
+        y = ys[-1]
+        for key in ['nfe', 'nje', 'nst']:
+            info[key] += part[key]
+        info['segments'] += 1
+        if not part['success']:
+            info['success'], info['message'] = False, part['message']
+            break
+    out[-1] = y
+    info['wall_s'] = time.perf_counter() - t0
+    return out, info;
+
+#%% Run from the command line
+
+# The anthroCO2 script as a forcing (a step of tropospheric CO2 at t = 0),
+# checked against the script's own run, and a yearly CO2 record with a
+# photosynthesis record read linearly with and without breakpoints and
+# read smoothly
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Forced transient runs of the Young2014 model')
+    parser.add_argument('--years', type = float, default = 250)
+    args = parser.parse_args(argv)
+
+    scenario = transient.anthroCO2(tpost = args.years)
+    ns, ypre = scenario['ns0'], scenario['ypre']
+    t = scenario['t']
+    index = list(ns['moleso'])
+    x0 = ypre[[index.index(name) for name in ['CO2t', 'COQt', 'COXt']]].sum() / ns['airt']
+    yref, info = transient.reference(scenario)
+    ref = outputs(ns, yref[-1])[0]['D17_O2t'][0]
+    print('%-32s %8.3f s  nfe %6d  D17_O2t %.6f' % ('script (jump in y0)', info['wall_s'],
+          info['nfe'], ref))
+
+    # The jump: stratospheric CO2 set by hand as the script does
+    x1 = (7.3e16 + yref[0][index.index('COQt')] + yref[0][index.index('COXt')]) / ns['airt']
+    model = forced(ns, {'xCO2t': step(0, x0, x1)})
+    y0 = ypre.copy()
+    y0[index.index('CO2s')] = 7.3e15
+    y, info = run(model, t, y0)
+    print('%-32s %8.3f s  nfe %6d  D17_O2t %.6f  difference %.1e' % ('xCO2t step', info['wall_s'],
+          info['nfe'], outputs(ns, y[-1])[0]['D17_O2t'][0],
+          abs(outputs(ns, y[-1])[0]['D17_O2t'][0] - ref)))
+
+    # A yearly record: CO2 rising 0.5% a year for 150 years (read smoothly,
+    # see forced), photosynthesis falling by 10% over the same years
+    years = np.arange(0, 151)
+    for kind, breaks in [('linear', True), ('linear', False), ('smooth', True)]:
+        model = forced(ns, {'xCO2t': series(years, x0 * 1.005 ** years, 'smooth'),
+                            'k21': series(years, ns['k21'] * (1 - 0.1 * years / 150), kind)})
+        y, info = run(model, t, ypre, breaks = breaks)
+        print('%-32s %8.3f s  nfe %6d  D17_O2t %.6f' % ('record %s, breakpoints %s' % (kind, breaks),
+              info['wall_s'], info['nfe'], outputs(ns, y[-1])[0]['D17_O2t'][0]))
+
+if __name__ == '__main__':
+    main()
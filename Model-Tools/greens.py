@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 18:04:40 2026
+
+@author: david
+"""
+
+#%% Load packages
+import time
+import argparse
+import warnings
+import numpy as np
+import pandas as pd
+from scipy.signal import fftconvolve
+from modelload import outputs
+from solve import integrate
+from fluxprofile import withvalues
+from forcing import dependents
+import transient
+
+#%% Impulse responses
+
+# Forcings with a response in the library: CO2 injected into the
+# troposphere or stratosphere (mol/yr, added to the CO2 isotopologue as the
+# transient scripts do) and a fractional change of photosynthesis (k21
+# scaled by 1 + g)
+forcings = ['CO2t', 'CO2s', 'k21']
+
+# Outputs tracked by default. d18_CO2t is left out: injected CO2 dilutes it
+# directly, and it is far from linear in the injection (85 per mil off at
+# the anthroCO2 jump).
+tracked = ['D17_O2t', 'd18_O2t']
+
+# Copy of a loaded model with photosynthesis scaled by 1 + g: k21 and every
+# constant f reads that the script derives from it (k21t and k21m in the
+# Splitbio scripts, found by forcing.dependents)
+def photosynthesis(ns, g):
+    k21 = float(ns['params'].get('k21', ns['k21']))
+    return withvalues(ns, **{key: c0 + c1 * k21 * (1 + g)
+                             for key, (c0, c1) in dependents(ns, 'k21').items()});
+
+# Largest forcings the library was checked to within 1e-3 per mil of
+# D17_O2t against nonlinear runs (see check): CO2 injected up to the moles
+# of the box at the base state (a doubling) and photosynthesis changed by
+# up to 5% (HalfNPP, -50%, is off by 0.08 per mil)
+validated = {'CO2': 1.0, 'k21': 0.05}
+
+# Isotope outputs of a run as a DataFrame over its time steps
+def series(ns, y, columns):
+    return outputs(ns, y)[0][columns];
+
+# Response of the outputs, per unit forcing, to one forcing applied at t = 0
+# from the steady state ypre. Central differences of two nonlinear runs
+# (+/- amp, relative) cancel the quadratic part of the response. Injections
+# are run as pulses of moles and give the impulse response per mole; k21 is
+# run as a step and gives the step response per unit g.
+def response(ns, ypre, forcing, t, amp = 1e-3, columns = tracked, rtol = 1e-10):
+    runs = []
+    for sign in [1, -1]:
+        if forcing == 'k21':
+            model, y0 = photosynthesis(ns, sign * amp), ypre
+            size = amp
+        else:
+            i = list(ns['moleso']).index(forcing)
+            size = amp * ypre[i]
+            model, y0 = ns, ypre.copy()
+            y0[i] += sign * size
+        y, info = integrate(model['f'], y0, t, rtol = rtol, atol = rtol,
+                            h0 = transient.h0)
+        if not info['success']:
+            raise RuntimeError('%s response run failed: %s' % (forcing, info['message']))
+        runs.append(series(ns, y, columns))
+    return (runs[0] - runs[1]) / (2 * size);
+
+# Library of discrete convolution kernels around the steady state ypre of
+# ns, on an even grid of spacing dt out to tmax years. Kernel k of a forcing
+# is the change of each output k steps after one step of unit forcing
+# (1 mol/yr of injection, or g = 1 of photosynthesis, held for dt).
+def library(ns, ypre, dt = 1.0, tmax = 3.5e4, columns = tracked):
+    t = np.arange(0, tmax + dt / 2, dt)
+    lib = {'dt': dt, 't': t, 'columns': list(columns),
+           'base': series(ns, ypre, columns).iloc[0], 'kernels': {},
+           'moles': {box: ypre[list(ns['moleso']).index(box)] for box in ['CO2t', 'CO2s']}}
+    for forcing in forcings:
+        resp = response(ns, ypre, forcing, t, columns = columns).values
+        if forcing == 'k21':
+            kernel = np.diff(resp, axis = 0, prepend = 0)
+        else:
+            kernel = resp * dt
+        lib['kernels'][forcing] = kernel
+    return lib;
+
+# Save and load a library as a .npz file
+def save(lib, path):
+    np.savez(path, dt = lib['dt'], t = lib['t'], columns = lib['columns'],
+             base = lib['base'].values, moles = [lib['moles'][box] for box in ['CO2t', 'CO2s']],
+             **{'kernel_' + name: kernel for name, kernel in lib['kernels'].items()})
+
+def load(path):
+    data = np.load(path)
+    columns = list(data['columns'])
+    return {'dt': float(data['dt']), 't': data['t'], 'columns': columns,
+            'base': pd.Series(data['base'], index = columns),
+            'moles': dict(zip(['CO2t', 'CO2s'], data['moles'])) if 'moles' in data.files else {},
+            'kernels': {key[7:]: data[key] for key in data.files if key.startswith('kernel_')}};
+
+#%% Scenario evaluation
+
+# Outputs for a scenario given as forcing time series on the library grid
+# (arrays, or functions of t), by FFT convolution of each forcing with its
+# kernel. Forcings not given are zero. Injections are in mol/yr; k21 is the
+# fractional change of photosynthesis. Forcings larger than the library was
+# checked for (see validated) give a warning.
+def respond(lib, **forcing):
+    t = lib['t']
+    total = np.zeros((len(t), len(lib['columns'])))
+    for name, values in forcing.items():
+        values = values(t) if callable(values) else np.asarray(values, dtype = float)
+        if name == 'k21':
+            size, limit = np.abs(values).max(), validated['k21']
+        elif name in lib['moles']:
+            size, limit = np.abs(np.cumsum(values) * lib['dt']).max() / lib['moles'][name], validated['CO2']
+        else:
+            size, limit = 0, 1
+        if size > limit:
+            warnings.warn('%s forcing of %.3g is outside the %.3g the library was checked for; '
+                          'the response is not linear there' % (name, size, limit))
+        kernel = lib['kernels'][name]
+        total += fftconvolve(values[:, None], kernel, axes = 0)[:len(t)]
+    return pd.DataFrame(total + lib['base'].values, index = t, columns = lib['columns']);
+
+#%% Check against the nonlinear model
+
+# Compare the library with nonlinear runs of the same forcing from ypre:
+# a jump of CO2 in both boxes to a multiple of the pre-industrial value and
+# a step change of photosynthesis. Returns the largest absolute difference
+# of each output over the library grid, with the run times. Forcings
+# outside validated are checked without a warning.
+def check(lib, ns, ypre, co2 = 1.5, gpp = -0.5, tend = None):
+    tend = lib['t'][-1] if tend is None else tend
+    n = int(round(tend / lib['dt'])) + 1
+    t = lib['t'][:n]
+    index = list(ns['moleso'])
+    rows = []
+    for name, model, y0, forcing in [
+            ('CO2 x%g' % co2, ns, None, 'CO2'),
+            ('k21 %+g' % gpp, photosynthesis(ns, gpp), ypre, 'k21')]:
+        if forcing == 'CO2':
+            y0 = ypre.copy()
+            pulses = {}
+            for box in ['CO2t', 'CO2s']:
+                y0[index.index(box)] *= co2
+                pulses[box] = np.zeros(len(lib['t']))
+                pulses[box][0] = (co2 - 1) * ypre[index.index(box)] / lib['dt']
+            t0 = time.perf_counter()
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                lin = respond(lib, **pulses).iloc[:n]
+        else:
+            t0 = time.perf_counter()
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                lin = respond(lib, k21 = np.full(len(lib['t']), gpp)).iloc[:n]
+        tlin = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        y, info = integrate(model['f'], y0, t, h0 = transient.h0)
+        tfull = time.perf_counter() - t0
+        full = series(ns, y, lib['columns'])
+        err = (lin.values - full.values)
+        row = {'scenario': name, 'linear_ms': tlin * 1e3, 'nonlinear_s': tfull}
+        row.update({'maxerr_' + col: np.abs(err[:, j]).max() for j, col in enumerate(lib['columns'])})
+        row.update({'final_' + col: full.values[-1, j] for j, col in enumerate(lib['columns'])})
+        rows.append(row)
+    return pd.DataFrame(rows);
+
+#%% Run from the command line
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Green's function library for CO2 and photosynthesis scenarios")
+    parser.add_argument('--base', choices = list(transient.scenarios), default = 'anthroCO2',
+                        help = 'transient script whose pre-industrial state is the base')
+    parser.add_argument('--dt', type = float, default = 1.0)
+    parser.add_argument('--tmax', type = float, default = 3.5e4)
+    parser.add_argument('--out', default = None, help = 'save the library to this .npz')
+    args = parser.parse_args(argv)
+
+    scenario = transient.scenarios[args.base]()
+    ns, ypre = scenario['ns0'], scenario['ypre']
+    t0 = time.perf_counter()
+    lib = library(ns, ypre, args.dt, args.tmax)
+    print('library built in %.2f s, %d steps of %g years' % (time.perf_counter() - t0,
+          len(lib['t']), lib['dt']))
+    if args.out:
+        save(lib, args.out)
+    with pd.option_context('display.width', 160):
+        for co2, gpp in [(1.05, -0.05), (7.3e16 / ypre[list(ns['moleso']).index('CO2t')], -0.5)]:
+            print(check(lib, ns, ypre, co2, gpp).to_string(index = False))
+
+if __name__ == '__main__':
+    main()
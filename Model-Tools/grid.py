@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 23:41:12 2026
+
+@author: david
+"""
+
+#%% Load packages
+import os
+import re
+import time
+import itertools
+import argparse
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
+import store as cubestore
+from modelload import variants, loadmodel, outputs
+from solve import steady
+from fluxprofile import withvalues
+from newton import continuation
+
+#%% Axes
+
+# Axes that are not a script parameter of their own. 'params' maps the
+# value on the axis to script parameters, set before the script runs so
+# that derived constants follow; 'constants' maps it to rate constants of
+# the loaded model. Any other axis name is taken as a script parameter.
+knobs = {
+    # CO2 in ppm as Young2014GPPxCO2x.py sets it: stratospheric CO2 from
+    # 4.8e15 moles at 270 ppm and ten times that in the troposphere
+    'ppmCO2': {'params': lambda value: {'CO2s0': value / 270 * 4.8e15,
+                                        'CO2t0': 10 * value / 270 * 4.8e15}},
+    # GPP multiplier on respiration (k12) and photosynthesis (k21), and on
+    # the terrestrial and marine parts the Splitbio scripts derive from them
+    # (k12t = ft * k12, ...), which are what their f reads
+    'GPP': {'constants': lambda ns, value: {name: value * ns[name] for name in ns
+                                            if re.fullmatch(r'k(12|21)[tm]?', name)}},
+    # Multiplier on the rate of CO2-H2O oxygen exchange in the hydrosphere:
+    # the forward (kr9, kr11) and back (kr10, kr12) constants together, and
+    # their terrestrial and marine parts, so that the equilibrium isotope
+    # ratios the scripts tune stay as they are
+    'kCO2H2O': {'constants': lambda ns, value: {name: value * ns[name] for name in ns
+                                                if re.fullmatch(r'kr(9|10|11|12)[tm]?', name)}}}
+
+# Script parameters and rate constants of one grid point
+def settings(point, params = {}):
+    script, constants = dict(params), []
+    for axis, value in point.items():
+        knob = knobs.get(axis, {})
+        if 'params' in knob:
+            script.update(knob['params'](value))
+        elif 'constants' in knob:
+            constants.append((knob['constants'], value))
+        else:
+            script[axis] = value
+    return script, constants;
+
+#%% Lines of the grid
+
+# Loaded models of the points of a line, loading the script again only
+# when its parameters change (axes of rate constants share one load)
+def models(name, points, params = {}):
+    last, base = None, None
+    for point in points:
+        script, constants = settings(point, params)
+        if script != last:
+            last, base = script, loadmodel(name, **script)
+        values = {}
+        for knob, value in constants:
+            values.update(knob(base, value))
+        yield withvalues(base, **values) if values else base
+
+# Steady states along one line of the grid (the fastest varying axis) by
+# continuation, so each point is warm started from the one before and
+# reuses its factorisation. Returns the outputs of every point (each with
+# its own constants), the states and the work.
+def line(name, points, params = {}, tol = 1e-10, theta = 0.5):
+    loaded = []
+    keep = lambda ns: loaded.append(ns) or ns
+    states, work = continuation((keep(ns) for ns in models(name, points, params)),
+                                tol, theta)
+    rows = []
+    for ns, y in zip(loaded, states):
+        isotopes, fracflux = outputs(ns, y)
+        rows.append(pd.concat([isotopes, fracflux], axis = 1).iloc[0])
+    return pd.DataFrame(rows).reset_index(drop = True), states, work;
+
+# line for pool.imap_unordered, which hands over one argument and gives the
+# results back in the order they finish
+def lineat(task):
+    i, args = task
+    return i, line(*args);
+
+#%% Grid
+
+# Steady states over the product of named parameter axes, given in order
+# from slowest to fastest varying as in nested loops, e.g.
+#     grid('Young2014', {'ppmCO2': np.linspace(94, 1094, 11),
+#                        'GPP': np.linspace(0.5, 1.5, 10)})
+# Each line along the last axis is solved by continuation; lines are
+# independent and run in a pool of processes (processes = 1 runs them
+# here). Keyword arguments are script parameters held fixed over the grid.
+#
+# Returns three DataFrames indexed by the axes (a MultiIndex): the cube of
+# isotope and mole fraction/flux outputs, the states (moleso columns) and
+# the solver work. A curve or a slice is taken by axis value, e.g.
+#     cube.xs(294, level = 'ppmCO2')['D17_O2t']
+#     cube['D17_O2t'].unstack('GPP')
+#
+# With store (a folder, see store.py) every line is appended to a result
+# cube on disk as soon as it finishes. Lines the store already holds are
+# not solved again, so an interrupted grid carries on where it stopped; the
+# cube returned is then read back from the store, and the states and work
+# only cover the lines solved in this call. A store over other axes raises
+# ValueError.
+def grid(name, axes, processes = None, tol = 1e-10, theta = 0.5, store = None, **params):
+    names = list(axes)
+    slow, fast = names[:-1], names[-1]
+    lines = [[dict(zip(slow, key), **{fast: value}) for value in axes[fast]]
+             for key in itertools.product(*[axes[axis] for axis in slow])]
+    index = pd.MultiIndex.from_product([axes[axis] for axis in names], names = names)
+    todo = list(range(len(lines)))
+    if store is not None and os.path.exists(cubestore.metapath(store)):
+        have = cubestore.meta(store)['axes']
+        if list(have) != names or any(len(have[axis]) != len(axes[axis]) or
+                                      not np.allclose(have[axis], axes[axis], rtol = 1e-12, atol = 0)
+                                      for axis in names):
+            raise ValueError('%s holds a cube over other axes (%s)' % (store, ', '.join(
+                             '%s: %d values from %g to %g' % (axis, len(v), v[0], v[-1])
+                             for axis, v in have.items())))
+        done = cubestore.written(store).values.reshape(len(lines), -1)
+        todo = [i for i in todo if not done[i].all()]
+    t0 = time.perf_counter()
+    tasks = [(i, (name, lines[i], params, tol, theta)) for i in todo]
+    results = {}
+
+    def finish(i, result):
+        results[i] = result
+        if store is None:
+            return
+        if not os.path.exists(cubestore.metapath(store)):
+            cubestore.create(store, axes, result[0].columns)
+        cubestore.append(store, pd.DataFrame(lines[i]), result[0])
+
+    if processes == 1:
+        for task in tasks:
+            finish(*lineat(task))
+    elif tasks:
+        with mp.get_context('spawn').Pool(processes) as pool:
+            for i, result in pool.imap_unordered(lineat, tasks):
+                finish(i, result)
+    n = len(axes[fast])
+    rows = np.concatenate([np.arange(i * n, (i + 1) * n) for i in todo]).astype(int) if todo else []
+    moleso = loadmodel(name, **params)['moleso']
+    states = pd.DataFrame(np.vstack([results[i][1] for i in todo]) if todo
+                          else np.zeros((0, len(moleso))), index = index[rows], columns = moleso)
+    work = pd.concat([results[i][2] for i in todo], ignore_index = True) if todo else pd.DataFrame()
+    work.index = index[rows]
+    work.attrs['wall_s'] = time.perf_counter() - t0
+    if store is not None:
+        cube = cubestore.read(store, missing = True)
+    else:
+        cube = pd.concat([results[i][0] for i in todo], ignore_index = True)
+        cube.index = index
+    return cube, states, work;
+
+#%% Run from the command line
+
+# The GPP x CO2 grid of Young2014GPPxCO2x.py by default; a few points are
+# checked against the time march of steady from the script's initial state
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Steady states over an N-D grid of parameters')
+    parser.add_argument('variant', nargs = '?', default = 'Young2014', choices = list(variants))
+    parser.add_argument('--axis', nargs = 4, action = 'append',
+                        metavar = ('NAME', 'START', 'STOP', 'NUM'),
+                        help = 'axis NAME with NUM values from START to STOP, slowest first')
+    parser.add_argument('--processes', type = int, default = None)
+    parser.add_argument('--output', default = 'D17_O2t')
+    parser.add_argument('--check', type = int, default = 3)
+    parser.add_argument('--store', default = None, help = 'folder of a result cube to append to')
+    args = parser.parse_args(argv)
+
+    spec = args.axis or [('ppmCO2', 94, 1094, 11), ('GPP', 0.5, 1.5, 10)]
+    axes = {axis: np.linspace(float(start), float(stop), int(num))
+            for axis, start, stop, num in spec}
+    cube, states, work = grid(args.variant, axes, args.processes, store = args.store)
+    print(cube[args.output].unstack(list(axes)[-1]).to_string(float_format = '%.4f'))
+    if len(work):
+        print('%d points in %.2f s (%.2f s of solves), nfe %d, %s' % (len(work), work.attrs['wall_s'],
+              work['wall_s'].sum(), work['nfe'].sum(), work['method'].value_counts().to_dict()))
+
+    # Spot checks against the script's own solve
+    rng = np.random.default_rng(0)
+    for i in rng.choice(len(cube), min(args.check, len(cube)), replace = False):
+        point = dict(zip(cube.index.names, cube.index[i]))
+        ns = next(models(args.variant, [point]))
+        t0 = time.perf_counter()
+        y = steady(ns)[0]
+        ref = outputs(ns, y)[0][args.output][0]
+        print('  %s: %s %.6f, steady %.6f (%.2f s), difference %.1e' % (point, args.output,
+              cube[args.output].iloc[i], ref, time.perf_counter() - t0,
+              abs(cube[args.output].iloc[i] - ref)))
+    return cube;
+
+if __name__ == '__main__':
+    main()
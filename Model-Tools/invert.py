@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 04:41:15 2026
+
+@author: david
+"""
+
+#%% Load packages
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from modelload import variants, loadmodel, outputs
+from newton import invariants, nearby, sweep
+from grid import models
+from emulate import box
+from linearise import sensitivities
+
+#%% Inversion
+
+# Observed tropospheric D17 of O2, per mil, that the FtFm runs match tGA
+# to (Wostbrock2020)
+observed = -0.441
+
+# Ranges searched when no bracket is given: the theta sweeps of the scripts
+# and ft from the FtFm runs
+bounds = dict(box, tGA = (0.505, 0.530), ft = (0.0, 1.0))
+
+# Value of a script parameter (param, or an axis of grid.knobs) at which the
+# steady state output of a variant equals target. Safeguarded Newton: each
+# step solves the model at the new value, warm started from the last state
+# and reusing its factorisation (newton.nearby), and takes the slope of the
+# output from the steady state sensitivities (linearise.sensitivities)
+# rather than from another solve. Steps that leave the bracket (bounds by
+# default) or the part of it known to hold the root fall back to bisection;
+# the bracket closes on the root once two values fall on either side.
+# Stops when the output is within ftol of target or the bracket is
+# narrower than xtol, and raises ValueError when the output at an end of
+# the bracket is still on the near side of target.
+#
+# Returns the value found and a table of every step (value, output, slope
+# and how it was reached).
+def invert(name, param, target = observed, output = 'D17_O2t', bracket = None, start = None,
+           ftol = 1e-6, xtol = 1e-9, maxiter = 30, tol = 1e-10, **params):
+    low, high = bounds[param] if bracket is None else bracket
+    ns = loadmodel(name, **params)
+    start = ns.get(param, (low + high) / 2) if start is None else start
+    C = invariants(ns)
+    y, fac, rows = None, None, []
+    t0 = time.perf_counter()
+
+    def evaluate(value, how):
+        nonlocal y, fac
+        t1 = time.perf_counter()
+        model = next(models(name, [{param: value}], params))
+        y, fac, work = nearby(model, y, fac, C, tol)
+        out = pd.concat(outputs(model, y), axis = 1).iloc[0][output]
+        slope = sensitivities(name, y, {param: value}, {param: high - low}, params = params)[1].loc[output, param]
+        rows.append({param: value, output: out, 'residual': out - target, 'slope': slope,
+                     'step': how, 'method': work['method'], 'nfe': work['nfe'],
+                     'wall_s': time.perf_counter() - t1})
+        return out - target, slope;
+
+    # Ends of the part of the bracket known to hold the root, with the sign
+    # of the residual at each end once it has been evaluated
+    a, b, ga, gb = low, high, None, None
+    x = min(max(start, low), high)
+    g, s = evaluate(x, 'start')
+    for i in range(maxiter):
+        if abs(g) < ftol:
+            break
+        if g * s > 0:
+            b, gb = x, g
+        else:
+            a, ga = x, g
+        if b - a < xtol:
+            break
+        new = x - g / s if s != 0 else np.nan
+        how = 'newton'
+        if not a < new < b:
+            if ga is None or gb is None:
+                # Not bracketed yet: try the end the slope points to
+                end = a if new <= a else b
+                if end == x:
+                    break
+                new, how = end, 'end'
+            else:
+                new, how = (a + b) / 2, 'bisection'
+        x = new
+        g, s = evaluate(x, how)
+        if how == 'end' and (g * s > 0 if end == low else g * s < 0):
+            raise ValueError('%s of %s stays %s %s over %s from %g to %g' % (output, name,
+                             'below' if g < 0 else 'above', target, param, low, high))
+    table = pd.DataFrame(rows)
+    table.attrs = {'wall_s': time.perf_counter() - t0, 'converged': abs(g) < ftol or b - a < xtol}
+    return x, table;
+
+#%% Run from the command line
+
+# Value of a parameter that reproduces an observed D17_O2t (Wostbrock2020
+# by default), checked against the linear regression of an even sweep as
+# Young2014tresp.py reads off its literature thetas
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Parameter value matching an observed output')
+    parser.add_argument('variant', nargs = '?', default = 'Young2014', choices = list(variants))
+    parser.add_argument('--param', default = 'tresp')
+    parser.add_argument('--target', type = float, nargs = '+', default = [observed])
+    parser.add_argument('--output', default = 'D17_O2t')
+    parser.add_argument('--bracket', type = float, nargs = 2, default = None)
+    parser.add_argument('--sweep', type = int, default = 0,
+                        help = 'check against a regression over this many even values')
+    args = parser.parse_args(argv)
+
+    for target in args.target:
+        value, table = invert(args.variant, args.param, target, args.output, args.bracket)
+        print('%s: %s = %.8f gives %s %.8f (target %g), %d solves in %.2f s, nfe %d' % (args.variant,
+              args.param, value, args.output, table[args.output].iloc[-1], target, len(table),
+              table.attrs['wall_s'], table['nfe'].sum()))
+        print(table.to_string(index = False, float_format = '%.6g'))
+    if args.sweep:
+        low, high = bounds[args.param] if args.bracket is None else args.bracket
+        values = np.linspace(low, high, args.sweep)
+        t0 = time.perf_counter()
+        states, work = sweep(args.variant, args.param, values)
+        ns = loadmodel(args.variant)
+        found = pd.concat(outputs(ns, states), axis = 1)[args.output].values
+        slope, intercept = np.polyfit(values, found, 1)
+        for target in args.target:
+            print('regression over %d solves (%.2f s): %s = %.8f' % (len(values), time.perf_counter() - t0,
+                  args.param, (target - intercept) / slope))
+
+if __name__ == '__main__':
+    main()
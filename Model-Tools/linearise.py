@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 04:05:22 2026
+
+@author: david
+"""
+
+#%% Load packages
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from modelload import variants, loadmodel, outputs
+from solve import jacobian, constant
+from newton import ptc, invariants, floor
+from grid import models, knobs
+from uncertainty import priors, quantile, evaluate
+
+#%% Steady state sensitivities
+
+# Change of the steady state y of a variant with every parameter of means
+# (script parameters, or axes of grid.knobs, at the values given), by the implicit function theorem:
+#     J dy = -df/dp,   C dy = C dy0/dp,   dy = dy0/dp for constant species,
+# the conserved totals and the constant reservoirs following the initial
+# state of the script. df/dp and dy0/dp are central differences of models
+# loaded at p +- step (relative to scale, the size of each parameter's
+# uncertainty), evaluated at y; the system is solved in units of the moles
+# of y. Returns dy/dp (one column per parameter) and the total derivative
+# of every isotope and fracflux output, which also counts where the output
+# cells read a parameter themselves (xJ reads k41), as central differences
+# along y +- step dy/dp.
+def sensitivities(name, y, means, scale = None, step = 1e-4, params = {}):
+    names = list(means)
+    scale = {p: max(abs(means[p]), 1e-12) for p in names} if scale is None else scale
+    ns = next(models(name, [means], params))
+    n = len(y)
+    fixed = constant(ns, y)
+    C = invariants(ns)
+    s = np.maximum(np.abs(y), floor)
+    J = jacobian(ns['f'], y)
+    A = np.vstack([J[~fixed], C, np.eye(n)[fixed]]) * s[None, :]
+    d = 1 / np.abs(A).max(axis = 1)
+    dydp, dout = np.zeros((n, len(names))), []
+    for k, p in enumerate(names):
+        h = step * scale[p]
+        up, down = [next(models(name, [dict(means, **{p: means[p] + sign * h})], params))
+                    for sign in [1, -1]]
+        dfdp = (up['f'](y, 0) - down['f'](y, 0)) / (2 * h)
+        dy0 = (np.asarray(up['y0'], dtype = float) - np.asarray(down['y0'], dtype = float)) / (2 * h)
+        b = np.concatenate([-dfdp[~fixed], C @ dy0, dy0[fixed]])
+        dydp[:, k] = s * np.linalg.lstsq(A * d[:, None], b * d, rcond = None)[0]
+        hi = pd.concat(outputs(up, y + h * dydp[:, k]), axis = 1).iloc[0]
+        lo = pd.concat(outputs(down, y - h * dydp[:, k]), axis = 1).iloc[0]
+        dout.append((hi - lo) / (2 * h))
+    return pd.DataFrame(dydp, index = ns['moleso'], columns = names), \
+        pd.concat(dout, axis = 1, keys = names);
+
+#%% Covariance propagation
+
+# Mean and standard deviation of a distribution spec (see uncertainty.priors)
+def moments(spec, points = 20001):
+    values = quantile(spec)((np.arange(points) + 0.5) / points)
+    return values.mean(), values.std();
+
+# First order uncertainty of every isotope and fracflux output of a variant
+# for parameters with means (name: value) and covariance cov (a DataFrame or array in the order of
+# means). One steady solve (ptc) and the sensitivities, so the cost is about
+# that of a single steady state and twice as many model loads and output
+# evaluations as there are parameters. Returns the output covariance and
+# the steady outputs, standard deviations and sensitivities (output by
+# parameter) as a table, and the work.
+def linearise(name, means, cov, step = 1e-4, tol = 1e-10, **params):
+    t0 = time.perf_counter()
+    names = list(means)
+    cov = np.asarray(cov, dtype = float).reshape(len(names), len(names))
+    ns = next(models(name, [means], params))
+    y, info = ptc(ns, tol = tol)
+    t1 = time.perf_counter()
+    sd = np.sqrt(np.diag(cov))
+    dydp, S = sensitivities(name, y, means, {p: sd[k] or abs(means[p]) or 1.0
+                                             for k, p in enumerate(names)}, step, params)
+    out = pd.DataFrame(S.values @ cov @ S.values.T, index = S.index, columns = S.index)
+    base = pd.concat(outputs(ns, y), axis = 1).iloc[0]
+    table = pd.concat([base.rename('value'), pd.Series(np.sqrt(np.diag(out)), index = S.index, name = 'sd'),
+                       S.add_prefix('d/d')], axis = 1)
+    work = {'solve_s': t1 - t0, 'sensitivity_s': time.perf_counter() - t1,
+            'nfe': info['nfe'], 'dydp': dydp}
+    return out, table, work;
+
+# Means and covariance of the default fractionation parameter distributions
+# (uncertainty.priors) that a variant's script sets, independent, with the
+# script's values as means
+def prior(name, dists = priors):
+    ns = loadmodel(name)
+    names = [p for p in dists if p in ns or p in knobs]
+    means = {p: float(ns[p]) if p in ns else 1.0 for p in names}
+    sds = [moments(dists[p])[1] for p in names]
+    return means, np.diag(np.square(sds));
+
+#%% Run from the command line
+
+# First order output uncertainty of a variant for the default parameter
+# distributions, or for given standard deviations (and correlations),
+# checked against Monte Carlo runs when --check is given
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Linearised propagation of parameter covariance')
+    parser.add_argument('variant', nargs = '?', default = 'sbmodWB', choices = list(variants))
+    parser.add_argument('--sd', nargs = 2, action = 'append', metavar = ('NAME', 'SD'),
+                        help = 'standard deviation of NAME about its script value')
+    parser.add_argument('--corr', nargs = 3, action = 'append', default = [],
+                        metavar = ('NAME', 'NAME', 'RHO'))
+    parser.add_argument('--outputs', nargs = '+', default = ['D17_O2t', 'd18_O2t', 'd17_O2t', 'D17_CO2t', 'xJ'])
+    parser.add_argument('--check', type = int, default = 0, help = 'Monte Carlo samples to check against')
+    args = parser.parse_args(argv)
+
+    if args.sd:
+        ns = loadmodel(args.variant)
+        means = {p: float(ns[p]) if p in ns else 1.0 for p, sd in args.sd}
+        sds = np.array([float(sd) for p, sd in args.sd])
+    else:
+        means, cov = prior(args.variant)
+        sds = np.sqrt(np.diag(cov))
+    names = list(means)
+    corr = np.eye(len(names))
+    for a, b, rho in args.corr:
+        corr[names.index(a), names.index(b)] = corr[names.index(b), names.index(a)] = float(rho)
+    cov = corr * np.outer(sds, sds)
+    out, table, work = linearise(args.variant, means, cov)
+    print('%s: %d parameters, solve %.2f s, sensitivities %.2f s' % (args.variant, len(names),
+          work['solve_s'], work['sensitivity_s']))
+    print(table.loc[args.outputs].to_string(float_format = '%.4g'))
+    print(out.loc[args.outputs, args.outputs].to_string(float_format = '%.3g'))
+
+    # Monte Carlo with normal parameters of the same covariance
+    if args.check:
+        rng = np.random.default_rng(0)
+        samples = pd.DataFrame(rng.multivariate_normal([means[p] for p in names], cov, args.check),
+                               columns = names)
+        t0 = time.perf_counter()
+        mc = evaluate(args.variant, samples, processes = 1)[0]
+        print('Monte Carlo, %d samples in %.1f s:' % (len(mc), time.perf_counter() - t0))
+        print(pd.DataFrame({'mean': mc[args.outputs].mean(), 'sd': mc[args.outputs].std(),
+                            'linear sd': table.loc[args.outputs, 'sd']}).to_string(float_format = '%.4g'))
+    return out;
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 16:30:11 2026
+
+@author: david
+"""
+
+#%% Load packages
+import time
+import argparse
+import numpy as np
+from scipy.linalg import expm, lu_factor, lu_solve
+from modelload import outputs
+from solve import jacobian
+from fluxprofile import terms, reaction, withvalues, families
+import transient
+
+#%% Splitting f
+
+# Split f into its linear part (transport between the boxes, hydrosphere
+# exchange kr9 - kr12, respiration, photosynthesis and the geosphere; every
+# rate constant that is not a K) and the stratospheric chemistry (K1 - K55).
+# Every term of f carries exactly one rate constant, so f is the sum of the
+# two. The linear part is L y + c, read off column by column from unit
+# states, which is exact where a finite difference would lose the small
+# columns against the large moles of the other species. The fast species
+# are the odd oxygen of every isotope (fluxprofile.families), which relax
+# in a tiny fraction of a year; the rest change over a year or longer.
+def split(ns):
+    names = terms(ns)
+    linear = withvalues(ns, **{name: 0 for name in names if reaction.match(name)})['f']
+    chem = withvalues(ns, **{name: 0 for name in names if not reaction.match(name)})['f']
+    n = len(ns['y0'])
+    c = np.asarray(linear(np.zeros(n), 0), dtype = float)
+    L = np.array([linear(unit, 0) - c for unit in np.eye(n)]).T
+    y = np.asarray(ns['y0'], dtype = float)
+    active = jacobian(chem, y).any(axis = 1) | (chem(y, 0) != 0)
+    fast = np.isin(list(ns['moleso']), families['Ox'])
+    return {'ns': ns, 'L': L, 'c': c, 'chem': chem, 'active': active,
+            'fast': fast};
+
+# Jacobian of f at y: L exactly, and the chemistry by differences over the
+# species it touches. Returns the factorised fast block, the response of
+# the fast species to the slow ones at quasi-steady state (X, so that
+# dyfast = -X dyslow, and B, which maps dyslow to the change of the whole
+# state) and the Jacobian of the slow species with the fast ones
+# eliminated (the Schur complement).
+def linearise(sp, y, t):
+    active, fast = sp['active'], sp['fast']
+    slow, full = ~fast, y.copy()
+    def g(ys, s):
+        full[active] = ys
+        return sp['chem'](full, s)[active]
+    J = sp['L'].copy()
+    J[np.ix_(active, active)] += jacobian(g, y[active], t)
+    lu = lu_factor(J[np.ix_(fast, fast)])
+    X = lu_solve(lu, J[np.ix_(fast, slow)])
+    Js = J[np.ix_(slow, slow)] - J[np.ix_(slow, fast)] @ X
+    B = np.zeros((slow.sum(), len(y)))
+    B[:, slow], B[:, fast] = np.eye(slow.sum()), -X.T
+    return {'lu': lu, 'X': X, 'Js': Js, 'B': B};
+
+# Changes of the state s years on from a state whose slow rates of change
+# are fs: s phi1(s Js) fs for the slow species, with phi1(z) = (exp(z) -
+# 1) / z, and -X times that for the fast ones; one row per offset in s. Js
+# is diagonalised once per linearisation, so any number of offsets costs
+# one product; where its eigenvectors are near singular the exponential of
+# [[s Js, s I], [0, 0]] is taken for each offset instead.
+def advance(lin, fs, s):
+    s = np.atleast_1d(np.asarray(s, dtype = float))
+    if 'V' not in lin:
+        w, V = np.linalg.eig(lin['Js'])
+        if np.linalg.cond(V) < 1e8:
+            lin['w'], lin['Vinv'] = w, np.linalg.inv(V)
+            lin['W'] = V.T @ lin['B']
+        lin['V'] = V
+    if 'W' not in lin:
+        m = len(lin['Js'])
+        A = np.zeros((2 * m, 2 * m))
+        A[:m, :m] = lin['Js']
+        A[:m, m:] = np.eye(m)
+        return np.array([expm(si * A)[:m, m:] @ fs for si in s]) @ lin['B'];
+    # s phi1(s w) = (exp(s w) - 1) / w, and s where w is zero
+    w = lin['w']
+    zero = w == 0
+    sg = np.expm1(np.outer(s, w)) / np.where(zero, 1, w)
+    sg[:, zero] = s[:, None]
+    return np.real(sg @ ((lin['Vinv'] @ fs)[:, None] * lin['W']));
+
+# Put the fast species of y at quasi-steady state (their rates of change to
+# zero with the slow species held) by chord iterations on the factorised
+# fast block. Returns the iterations taken, or None if they did not
+# converge to tol (relative) in maxiter.
+def qss(sp, lin, y, t, tol = 1e-10, maxiter = 20):
+    fast = sp['fast']
+    for it in range(1, maxiter + 1):
+        d = lu_solve(lin['lu'], sp['ns']['f'](y, t)[fast])
+        y[fast] -= d
+        if np.all(np.abs(d) <= tol * np.abs(y[fast])):
+            return it
+    return None;
+
+#%% Quasi-steady exponential integrator
+
+# Integration from y0 with the fast photochemistry held at quasi-steady
+# state, returning the states at the times t. The run takes steps of h
+# years (the last one shorter to end on t[-1]) whatever the output times.
+# A step advances the slow species by the exponential Euler step
+#     dyslow = tau phi1(tau Js) fslow(y)
+# which is exact for the linear block and takes any step the slow modes
+# allow, moves the fast species along with them (-X dyslow) and brings them
+# back to quasi-steady state. There is no stiff solver to restart, so a
+# step costs a few RHS calls. Output times inside a step are read off the
+# same formula at their offsets, all in one product. The linearisation is
+# kept from step to step and made again only when the fast species take
+# more than reuse chord iterations to settle, so a run that drifts slowly
+# (anthroCO2) makes it once or twice. f must not depend on t beyond what
+# the linearisation at the start of a step sees.
+def qsssolve(ns, y0, t, h = 1.0, reuse = 3, tol = 1e-10, sp = None):
+    if sp is None:
+        sp = split(ns)
+    fast = sp['fast']
+    slow = ~fast
+    t = np.asarray(t, dtype = float)
+    t0 = time.perf_counter()
+    y = np.empty((len(t), len(y0)))
+    yn = np.array(y0, dtype = float)
+    nje = 1
+    lin = linearise(sp, yn, t[0])
+    nfe = 2 * sp['active'].sum()
+
+    def settle(yi, ti):
+        nonlocal lin, nfe, nje
+        it = qss(sp, lin, yi, ti, tol)
+        nfe += it or 20
+        if it is None or it > reuse:
+            lin = linearise(sp, yi, ti)
+            nfe, nje = nfe + 2 * sp['active'].sum(), nje + 1
+            it = qss(sp, lin, yi, ti, tol)
+            nfe += it or 20
+        return it is not None;
+
+    success = settle(yn, t[0])
+    y[0] = yn
+    tn, k, nsteps = t[0], 1, 0
+    while k < len(t):
+        tau = min(h, t[-1] - tn)
+        if t[-1] - tn - tau < 1e-9 * h:
+            tau = t[-1] - tn
+        fs = ns['f'](yn, tn)[slow]
+        nfe, nsteps = nfe + 1, nsteps + 1
+        j = k + np.searchsorted(t[k:], tn + tau - 1e-9 * h)
+        dy = advance(lin, fs, np.append(t[k:j] - tn, tau))
+        y[k:j] = yn + dy[:-1]
+        yn = yn + dy[-1]
+        success = settle(yn, tn + tau) and success
+        tn, k = tn + tau, j
+        if k < len(t) and t[k] <= tn + 1e-9 * h:
+            y[k] = yn
+            k += 1
+    info = {'nst': nsteps, 'nfe': int(nfe), 'nje': nje, 'success': success,
+            'wall_s': time.perf_counter() - t0}
+    return y, info;
+
+#%% Run from the command line
+
+# Steps compared by default: the anthroCO2 transient is over in centuries,
+# the HalfNPP one takes tens of thousands of years
+steps = {'anthroCO2': [1, 10, 100], 'HalfNPP': [100, 1000, 2500]}
+
+# Compare the quasi-steady integrator with odeint on a transient scenario,
+# both giving the states at the script's output times
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Quasi-steady exponential integration of the transient scenarios')
+    parser.add_argument('scenario', choices = list(transient.scenarios))
+    parser.add_argument('--steps', nargs = '+', type = float, default = None)
+    args = parser.parse_args(argv)
+
+    scenario = transient.scenarios[args.scenario]()
+    ns = scenario['ns']
+    sp = split(ns)
+    t = scenario['t']
+    yref, ref = transient.reference(scenario)
+    isoref = outputs(ns, yref)[0]['D17_O2t'].values
+    print('odeint   %.3f s  nfe %6d' % (ref['wall_s'], ref['nfe']))
+    for h in args.steps or steps[args.scenario]:
+        y, info = qsssolve(ns, scenario['y0'], t, h, sp = sp)
+        iso = outputs(ns, y)[0]['D17_O2t'].values
+        print('h=%-5g  %.3f s  nfe %6d  nje %3d  D17_O2t %.6f at %g years, largest error %.1e' % (h,
+              info['wall_s'], info['nfe'], info['nje'], iso[-1], t[-1], np.abs(iso - isoref).max()))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 09:12:40 2026
+
+@author: david
+"""
+
+#%% Load packages
+import io
+import os
+import re
+import contextlib
+import warnings
+import numpy as np
+import pandas as pd
+
+#%% Model variants
+
+# Repository root, one folder above Model-Tools
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Steady state model scripts, keyed by short variant name
+variants = {
+    'Young2014': 'Model-Runs/Original/Young2014.py',
+    'sbbase': 'Model-Runs/Splitbio/BaseMod/BaseModSS/Young2014sbbase.py',
+    'sbmod': 'Model-Runs/Splitbio/BaseMod/BaseModSS/Young2014sbmod.py',
+    'sbmodWB': 'Model-Runs/Splitbio/BaseMod/BaseModSS/Young2014sbmodWB.py',
+    'sbmodWBrm': 'Model-Runs/Splitbio/BaseMod/BaseModSS/Young2014sbmodWBrm.py',
+    'sbmodWBchem': 'Model-Runs/Splitbio/BaseMod/BaseModSS/Young2014sbmodWBchem.py',
+    'sbmodWBrmchem': 'Model-Runs/Splitbio/BaseMod/BaseModSS/Young2014sbmodWBrmchem.py',
+    'sbmodWBrmchem2comp': 'Model-Runs/Splitbio/BaseMod/BaseModSS/Young2014sbmodWBrmchem2comp.py',
+    'Y14WB2': 'Model-Runs/Splitbio/UpdatedCO2/UpdatedCO2SS/Y14WB2.py'}
+
+#%% Reading the model scripts
+
+# Split a script into its #%% cells, keeping the header line with each cell
+def cells(src):
+    cells = []
+    for line in src.splitlines():
+        if line.startswith('#%%') or not cells:
+            cells.append([])
+        cells[-1].append(line)
+    return ['\n'.join(cell) for cell in cells];
+
+# Replace the first top level assignment of each parameter with a new value
+def setparams(src, params):
+    for name, value in params.items():
+        pattern = re.compile(r'^%s = [^#\n]*' % re.escape(name), re.M)
+        if not pattern.search(src):
+            raise KeyError('%s is not assigned in the model script' % name)
+        src = pattern.sub('%s = %r ' % (name, value), src, count = 1)
+    return src;
+
+# The script's target moles from Young 2014 (molest), which its last cell
+# checks the solution against
+targets = re.compile(r'^molest = pd\.DataFrame\(np\.array\((\[.*?\])\)', re.M | re.S)
+
+# Model definitions (everything before the solver call), output cells and
+# the target moles (NaN where the script gives none)
+def readscript(name, params = {}):
+    path = os.path.join(root, variants[name])
+    with open(path, encoding = 'utf-8') as file:
+        src = setparams(file.read(), params)
+    lines = src.splitlines()
+    solve = next(i for i, line in enumerate(lines)
+                 if 'odeint(' in line and not line.startswith('from'))
+    model = '\n'.join(lines[:solve])
+    post = []
+    keep = False
+    for cell in cells(src):
+        if cell.startswith('#%% Isotopes output'):
+            keep = True
+        elif cell.startswith('#%% Calculate difference'):
+            keep = False
+        if keep:
+            post.append(cell)
+    match = targets.search(src)
+    molest = np.array(eval(match.group(1), {'np': np}), dtype = float) if match else []
+    return path, model, '\n'.join(post), molest;
+
+#%% Loading a model
+
+# The scripts' output grid, t = np.arange(start, stop, step). Only its ends
+# and spacing are kept, so it is read as a tuple instead of allocating its
+# 1e7 points on every load (half the cost of loading a model).
+grid = re.compile(r'^t = np\.arange\((.*)\)[ \t]*$', re.M)
+
+# Execute a variant up to its solver call and return the namespace holding
+# f, y0, moleso and every rate constant. Keyword arguments override the
+# values assigned in the script (e.g. tresp = 0.5149, ft = 0.5) so that
+# derived constants are recomputed exactly as the script would.
+def loadmodel(name, **params):
+    path, model, post, molest = readscript(name, params)
+    model = grid.sub(r't = (\1)', model)
+    ns = {'__name__': 'model_' + name, '__file__': path}
+    with warnings.catch_warnings(), contextlib.redirect_stdout(io.StringIO()):
+        warnings.simplefilter('ignore', FutureWarning)
+        exec(compile(model, path, 'exec'), ns)
+
+    # Keep the script time grid as (start, stop, spacing) instead of 1e7
+    # points, with the last point arange would give
+    t = ns.pop('t')
+    if isinstance(t, tuple):
+        start, stop, step = (float(value) for value in t)
+        n = int(np.ceil((stop - start) / step))
+        t = (start, start + (n - 1) * step, (start + step) - start)
+    else:
+        t = (t[0], t[-1], t[1] - t[0])
+    ns['tgrid'] = tuple(float(value) for value in t)
+
+    # Target moles by species. Some scripts list only the atmosphere, which
+    # comes first in moleso; the rest are NaN.
+    ns['molest'] = np.full(len(ns['moleso']), np.nan)
+    ns['molest'][:len(molest)] = molest[:len(ns['moleso'])]
+    ns['variant'] = name
+    ns['params'] = dict(params)
+    ns['post'] = compile(post, path, 'exec')
+    return ns;
+
+# Isotope and mole fraction/flux outputs for one state or a stack of states,
+# using the variant's own output cells. Rows are states, columns are the
+# script's isotopeso and fracfluxo.
+def outputs(ns, y):
+    y = np.atleast_2d(y)
+    out = dict(ns)
+    out['moles'] = pd.DataFrame(y.T, index = ns['moleso'])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        exec(out['post'], out)
+    isotopes = pd.DataFrame(np.asarray(out['isotopes'], dtype = float).T,
+                            columns = out['isotopeso'])
+    fracflux = pd.DataFrame(np.asarray(out['fracflux'], dtype = float).T,
+                            columns = out['fracfluxo'])
+    return isotopes, fracflux;
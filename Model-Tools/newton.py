@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 21:31:46 2026
+
+@author: david
+"""
+
+#%% Load packages
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from scipy.linalg import lu_factor, lu_solve
+from modelload import variants, loadmodel, outputs
+from solve import steady, jacobian, constant, logger, logline
+from fluxprofile import terms, withvalues
+from timescales import tcons
+
+#%% Conserved quantities
+
+# Linear combinations of the species that f never changes, c f(y) = 0 for
+# every y (total carbon of the CO2 boxes), as the rows of a matrix scaled to
+# unit largest entry. Every term of f carries one rate constant, so f is the
+# sum of one part per constant; each part is evaluated on its own (the other
+# constants set to zero), and c is the null space of the stacked parts. They
+# are taken at a few random states with every species of order one mole, so
+# no term is lost against the larger ones, and at more than one state so
+# that channels sharing a constant are told apart. The constant species are
+# left out.
+def invariants(ns, tol = 1e-10, seed = 0):
+    names = terms(ns)
+    n = len(ns['y0'])
+    rng = np.random.default_rng(seed)
+    parts = [withvalues(ns, **{other: 0 for other in names if other != name})['f']
+             for name in names]
+    rows = [part(y, 0) for y in np.exp(rng.normal(size = (4, n))) for part in parts]
+    G = np.array([row / np.abs(row).max() for row in rows if np.abs(row).max() > 0])
+    fixed = constant(ns)
+    u, sv, vt = np.linalg.svd(G[:, ~fixed])
+    C = np.zeros((len(sv) - np.sum(sv > tol * sv[0]), n))
+    C[:, ~fixed] = vt[len(sv) - len(C):]
+    C = C / C[np.arange(len(C)), np.abs(C).argmax(axis = 1)][:, None]
+    return np.where(np.abs(C) < tol, 0, C);
+
+#%% Linear algebra
+
+# Moles below which a species is scaled as if it held this many; the
+# smallest steady state reservoir of any variant (O1D) holds about 1.5
+floor = 1.0
+
+# LU factorisation of the implicit Euler matrix I / dt - J at the state y,
+# in units of the moles of y and with its rows equilibrated
+def factorise(J, y, dt):
+    s = np.maximum(np.abs(y), floor)
+    A = np.eye(len(y)) / dt - J * s[None, :] / s[:, None]
+    d = 1 / np.abs(A).max(axis = 1)
+    return {'lu': lu_factor(A * d[:, None]), 'd': d, 's': s, 'dt': dt};
+
+# Change of the state (moles) solving the factorised system for f(y) = fy
+def solvestep(fac, fy):
+    return fac['s'] * lu_solve(fac['lu'], fac['d'] * fy / fac['s']);
+
+# Move y back onto the conserved totals C y = total, each species in
+# proportion to its moles s
+def project(C, total, y, s):
+    if not len(C):
+        return y
+    CS = C * s[None, :]
+    return y + CS.T @ np.linalg.solve(CS @ C.T, total - C @ y);
+
+#%% Pseudo transient continuation
+
+# Steady state of a loaded model by pseudo transient continuation. Each
+# iteration is one linearised implicit Euler step of size dt,
+#     (I / dt - J) dy = f(y),
+# solved in units of the current moles (and with the rows equilibrated) so
+# the forty decades between species do not reach the linear algebra. dt
+# grows regrow times after every full step that did not double the
+# residual, and the matrix is then factored again with the same Jacobian;
+# between growths the factorisation is reused. The Jacobian is evaluated
+# again when a step raised the residual, or once dt has reached its cap
+# when the residual falls by less than rho a step. A step that would cut a
+# species below a tenth of its moles is shortened; one shortened below a
+# tenth, or that grows the residual tenfold, is taken again with a tenth of
+# dt. dt is held below tcons, where the conserved quantities make the
+# matrix singular. Implicit Euler keeps them at their values in y0, as the
+# time march does, but only to the accuracy of the linear solve, so every
+# step is projected back onto them (conserved, from invariants when not
+# given).
+#
+# Converged once dt has reached its cap and no species moves by more than
+# tol (relative) in a step. info carries the work (nfe, nje Jacobians, nlu
+# factorisations, nsolve back substitutions, iterations) and is logged on
+# the solve logger as steady does.
+def ptc(ns, y0 = None, dt0 = 1e-12, tol = 1e-10, rho = 0.5, regrow = 10,
+        dtmax = tcons, maxiter = 1000, conserved = None):
+    t0 = time.perf_counter()
+    f = ns['f']
+    y = np.asarray(ns['y0'] if y0 is None else y0, dtype = float).copy()
+    n = len(y)
+    info = {'nfe': 1, 'nje': 0, 'nlu': 0, 'nsolve': 0, 'iterations': 0,
+            'rejected': 0, 'success': False}
+    fy = f(y, 0)
+    C = invariants(ns) if conserved is None else conserved
+    total = C @ y
+
+    def factor(J, dt):
+        info['nlu'] += 1
+        return factorise(J, y, dt);
+
+    # The residual is measured as each species' departure from its own
+    # local balance, f / (y |J_ii|): the photochemistry is out of balance by
+    # a few parts in 1e9 at any step, which is nothing against its 1e-16
+    # year lifetimes but would swamp a residual in moles per year
+    def newjac():
+        info['nje'] += 1
+        info['nfe'] += 2 * n
+        J = jacobian(f, y)
+        return J, 1 / (np.maximum(np.abs(y), floor) * np.maximum(np.abs(np.diag(J)), 1 / tcons));
+
+    (J, w), dt = newjac(), dt0
+    fac, r = factor(J, dt), np.linalg.norm(fy * w)
+    fresh, stale = True, False
+    while info['iterations'] < maxiter:
+        info['iterations'] += 1
+        dy = solvestep(fac, fy)
+        info['nsolve'] += 1
+        down = dy < 0
+        alpha = min(1.0, 0.9 * np.min(y[down] / -dy[down])) if down.any() else 1.0
+        ynew = project(C, total, y + alpha * dy, fac['s'])
+        fnew = f(ynew, 0)
+        info['nfe'] += 1
+        rnew = np.linalg.norm(fnew * w)
+        # A rejected step leaves y where it was, so the Jacobian still holds
+        # (or is as stale as before) and only the step shrinks; a stale one
+        # is evaluated again after the next accepted step
+        if alpha < 0.1 or not np.isfinite(rnew) or rnew > 10 * r:
+            info['rejected'] += 1
+            dt = dt / 10
+            stale = stale or not fresh
+            fac = factor(J, dt)
+            continue
+        y, fy, rold, r = ynew, fnew, r, rnew
+        if dt >= dtmax and np.max(np.abs(alpha * dy / fac['s'])) < tol:
+            info['success'] = True
+            break
+        # dt grows after every full step that lowered the residual; the
+        # Jacobian is evaluated again when a step raised it, or once dt is
+        # at its cap when the residual falls by less than rho a step
+        grow = alpha == 1 and r <= 2 * rold and dt < dtmax
+        if stale or not fresh and (r > rold or (dt >= dtmax and r > rho * rold)):
+            J, w = newjac()
+            r, fresh, stale = np.linalg.norm(fy * w), True, False
+        else:
+            fresh = False
+        if grow:
+            dt = min(dt * regrow, dtmax)
+        if grow or fresh:
+            fac = factor(J, dt)
+    info['dt'] = dt
+    info['residual'] = float(np.max(np.abs(fy * w)))
+    info['message'] = 'Converged.' if info['success'] else 'No convergence in %d iterations.' % maxiter
+    info['wall_s'] = time.perf_counter() - t0
+    info = dict({'variant': ns.get('variant'), 'params': ns.get('params'),
+                 'method': 'ptc'}, **info)
+    logger.info(logline(info))
+    return y, info;
+
+#%% Sweeps
+
+# dt of the factorisation a sweep reuses: the scripts' horizon, long enough
+# that a chord step is nearly a Newton step for every relaxing mode (the
+# slowest, the geosphere, takes ~2e4 years), and short of tcons so rounding
+# along the conserved directions is not amplified into steps of 1e-8 that
+# never settle
+dtchord = 1e6
+
+# Steady state by chord (modified Newton) iteration from y0, the steady
+# state of a neighbouring model, reusing the factorisation fac of that
+# model's matrix at dt = dtchord instead of factoring one of its own. The
+# start is first moved onto this model's conserved totals. Stops, with
+# success False, as soon as a step shrinks by less than theta on the one
+# before (the factorisation is too far from this model to converge fast) or
+# would leave a species negative, returning the last state reached.
+def chord(ns, y0, fac, C, tol = 1e-10, theta = 0.5, maxiter = 50):
+    f = ns['f']
+    total = C @ ns['y0']
+    y = project(C, total, np.asarray(y0, dtype = float), fac['s'])
+    info = {'nfe': 0, 'nsolve': 0, 'iterations': 0, 'success': False}
+    last = np.inf
+    while info['iterations'] < maxiter:
+        info['iterations'] += 1
+        dy = solvestep(fac, f(y, 0))
+        info['nfe'] += 1
+        info['nsolve'] += 1
+        size = np.max(np.abs(dy / fac['s']))
+        if np.any(y + dy < 0) or size > theta * last:
+            break
+        y = project(C, total, y + dy, fac['s'])
+        if size < tol:
+            info['success'] = True
+            break
+        last = size
+    return y, info;
+
+# Steady state of ns from ystart, the steady state of a neighbouring model
+# in parameter space (None for none), reusing that model's factorisation
+# fac (chord); when the chord converges slowly the matrix is factored again
+# where it stopped, and if that fails too the point is solved by ptc from
+# the warm start. With reuse False, or no neighbour, it is solved by ptc
+# from its initial state. Returns the state, the factorisation to hand on
+# to the next neighbour (None without reuse) and the work.
+def nearby(ns, ystart, fac, C, tol = 1e-10, theta = 0.5, reuse = True):
+    n = len(ns['y0'])
+    row = {'method': 'ptc', 'iterations': 0, 'nfe': 0, 'nje': 0,
+           'nlu': 0, 'nsolve': 0, 'success': False}
+
+    def count(info, **extra):
+        for key in ['iterations', 'nfe', 'nje', 'nlu', 'nsolve']:
+            row[key] += info.get(key, 0) + extra.get(key, 0)
+        row['success'] = info['success']
+
+    if reuse and fac is not None and ystart is not None:
+        y, info = chord(ns, ystart, fac, C, tol, theta)
+        count(info)
+        row['method'] = 'chord'
+        if not info['success']:
+            fac = factorise(jacobian(ns['f'], y), y, dtchord)
+            y, info = chord(ns, y, fac, C, tol, theta)
+            count(info, nfe = 2 * n, nje = 1, nlu = 1)
+            row['method'] = 'chord, refactored'
+    if not row['success']:
+        y0 = None
+        if reuse and ystart is not None:
+            y0 = project(C, C @ ns['y0'], ystart, np.maximum(np.abs(ystart), floor))
+        y, info = ptc(ns, y0, tol = tol, conserved = C)
+        count(info)
+        row['method'] = 'ptc'
+        fac = None
+        if reuse:
+            fac = factorise(jacobian(ns['f'], y), y, dtchord)
+            count({'success': info['success']}, nfe = 2 * n, nje = 1, nlu = 1)
+    return y, fac, row;
+
+# Steady states of a sequence of loaded models (neighbours in parameter
+# space), in order, each solved by nearby from the one before; the first
+# is solved by ptc from its script's initial state. models may be a
+# generator, so that loading each model counts in its wall time. Returns
+# the states, one row per model, and a table of the work at each point.
+def continuation(models, tol = 1e-10, theta = 0.5, reuse = True):
+    rows, states, fac, C = [], [], None, None
+    t0 = time.perf_counter()
+    for ns in models:
+        if C is None:
+            C = invariants(ns)
+        y, fac, row = nearby(ns, states[-1] if states else None, fac, C, tol, theta, reuse)
+        row['wall_s'] = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        rows.append(row)
+        states.append(y)
+    return np.array(states), pd.DataFrame(rows);
+
+# Steady states of a variant over a sequence of values of one script
+# parameter (tresp, tevap, KMIF, ft, ...), by continuation
+def sweep(name, param, values, tol = 1e-10, theta = 0.5, reuse = True, **params):
+    models = (loadmodel(name, **dict(params, **{param: value})) for value in values)
+    states, table = continuation(models, tol, theta, reuse)
+    table.insert(0, param, list(values))
+    return states, table;
+
+#%% Run from the command line
+
+# Pseudo transient continuation against the time march of steady, for every
+# variant from the script's initial conditions; with --sweep, a parameter
+# sweep of one variant with and without reuse of the factorisation
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Steady states by pseudo transient continuation')
+    parser.add_argument('variants', nargs = '*', default = list(variants))
+    parser.add_argument('--tol', type = float, default = 1e-10)
+    parser.add_argument('--sweep', nargs = 4, metavar = ('PARAM', 'START', 'STOP', 'NUM'),
+                        help = 'sweep PARAM over NUM values from START to STOP')
+    args = parser.parse_args(argv)
+
+    if args.sweep:
+        param, start, stop, num = args.sweep
+        values = np.linspace(float(start), float(stop), int(num))
+        for name in args.variants:
+            results = {}
+            for reuse in [True, False]:
+                Y, table = sweep(name, param, values, args.tol, reuse = reuse)
+                results[reuse] = outputs(loadmodel(name), Y)[0]['D17_O2t'].values
+                print('%s %s sweep, %d points, reuse %s: %.2f s  nfe %d  nje %d  nlu %d  nsolve %d  %s' % (
+                      name, param, len(values), reuse, table['wall_s'].sum(), table['nfe'].sum(),
+                      table['nje'].sum(), table['nlu'].sum(), table['nsolve'].sum(),
+                      table['method'].value_counts().to_dict()))
+            print('largest D17_O2t difference %.1e' % np.abs(results[True] - results[False]).max())
+        return
+
+    print('%-20s %8s %8s %5s %4s %4s %6s %6s  %10s %10s' % ('variant', 'march s', 'ptc s',
+          'iter', 'nje', 'nlu', 'nfe', 'march', 'D17_O2t', 'difference'))
+    for name in args.variants:
+        ns = loadmodel(name)
+        ymarch, march = steady(ns)
+        y, info = ptc(ns, tol = args.tol)
+        iso = outputs(ns, np.vstack([ymarch, y]))[0]['D17_O2t'].values
+        print('%-20s %8.3f %8.3f %5d %4d %4d %6d %6d  %10.6f %10.1e%s' % (name, march['wall_s'],
+              info['wall_s'], info['iterations'], info['nje'], info['nlu'], info['nfe'],
+              march['nfe'], iso[1], abs(iso[1] - iso[0]),
+              '' if info['success'] else '  ' + info['message']))
+
+if __name__ == '__main__':
+    main()
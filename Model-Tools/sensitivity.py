@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 03:12:40 2026
+
+@author: david
+"""
+
+#%% Load packages
+import argparse
+import numpy as np
+import pandas as pd
+from scipy.stats import qmc
+from modelload import variants, loadmodel
+from uncertainty import quantile, evaluate, readcache, writecache
+from grid import knobs
+
+#%% Factors
+
+# Parameters whose share of the output variance is looked for, if the
+# variant's script sets them: the respiration, photosynthesis and mixing
+# rate constants, the MIF of ozone formation, tresp, ft, the O(1D) + CO2
+# quenching factor TNF and the rate of CO2-H2O exchange in the
+# hydrosphere. The hydrosphere constants are scaled together (grid.knobs
+# kCO2H2O): taken one at a time they move the equilibrium isotope ratios
+# the scripts tune them to, and D17_O2t then spans tens of per mil.
+candidates = ['k12', 'k21', 'k41', 'k14', 'KMIF', 'tresp', 'ft', 'TNF', 'kCO2H2O']
+
+# Ranges of the factors: the thetas, ft and KMIF over the ranges of the
+# scripts' sweeps (Young2014tresp.py, the FtFm runs, Young2014sbMIF.py)
+# and the hydrosphere multiplier from half to twice; every other factor
+# from half to twice its value in the script, evenly in its log
+ranges = {'KMIF': ('uniform', 1.0, 1.1),
+          'tresp': ('uniform', 0.505, 0.530),
+          'ft': ('uniform', 0.3, 0.9),
+          'kCO2H2O': ('loguniform', 0.5, 2.0)}
+
+# Distributions (see uncertainty.priors) of the factors of a variant
+def factors(name, names = candidates):
+    ns = loadmodel(name)
+    return {p: ranges.get(p, ('loguniform', ns.get(p, 1) / 2, ns.get(p, 1) * 2))
+            for p in names if p in knobs or p in ns and np.isscalar(ns[p])};
+
+#%% Saltelli design
+
+# Points of the Saltelli design for n base samples of the factors: from a
+# scrambled Sobol sequence in twice as many dimensions, the matrices A and
+# B, and for every factor i A with column i taken from B. The points of
+# one base sample are kept together (A, each AB_i, B), as they differ in
+# one factor from A and follow one another closely when solved in order.
+# Returns the points and their roles (0 for A, i + 1 for AB_i, -1 for B)
+# and base samples.
+def design(dists, n = 256, seed = 0):
+    d = len(dists)
+    u = qmc.Sobol(2 * d, seed = seed).random(n)
+    A, B = u[:, :d], u[:, d:]
+    rows, role, base = [], [], []
+    for j in range(n):
+        rows.append(A[j])
+        role.append(0)
+        for i in range(d):
+            ab = A[j].copy()
+            ab[i] = B[j, i]
+            rows.append(ab)
+            role.append(i + 1)
+        rows.append(B[j])
+        role.append(-1)
+        base += [j] * (d + 2)
+    rows = np.array(rows)
+    points = pd.DataFrame({name: quantile(spec)(rows[:, i]) for i, (name, spec) in enumerate(dists.items())})
+    points['role'], points['base'] = role, base
+    return points;
+
+#%% Indices
+
+# First order (Saltelli 2010) and total (Jansen) indices of the factors
+# from the outputs y of a design, for base samples taken as rows of take
+# (one row of base sample numbers per bootstrap resample)
+def indices(y, role, base, d, take):
+    n = base.max() + 1
+    Y = np.full((n, d + 2), np.nan)
+    Y[base, np.where(role < 0, d + 1, role)] = y
+    fA, fB, fAB = Y[take, 0], Y[take, d + 1], Y[take, 1:d + 1]
+    var = np.concatenate([fA, fB], axis = -1).var(axis = -1)
+    S1 = (fB[..., None] * (fAB - fA[..., None])).mean(axis = -2) / var[..., None]
+    ST = 0.5 * ((fA[..., None] - fAB) ** 2).mean(axis = -2) / var[..., None]
+    return S1, ST;
+
+# First order and total indices of every factor for one output of a solved
+# design, with bootstrap confidence intervals (level, from resamples of the
+# base samples)
+def analyse(table, output = 'D17_O2t', resamples = 1000, level = 0.95, seed = 0):
+    names = [c for c in table.columns[:list(table.columns).index('role')]]
+    d = len(names)
+    role, base = table['role'].values.astype(int), table['base'].values.astype(int)
+    n = base.max() + 1
+    S1, ST = indices(table[output].values, role, base, d, np.arange(n))
+    boot = np.random.default_rng(seed).integers(0, n, (resamples, n))
+    S1b, STb = indices(table[output].values, role, base, d, boot)
+    q = [(1 - level) / 2, (1 + level) / 2]
+    out = pd.DataFrame({'S1': S1, 'S1_low': np.quantile(S1b, q[0], axis = 0),
+                        'S1_high': np.quantile(S1b, q[1], axis = 0),
+                        'ST': ST, 'ST_low': np.quantile(STb, q[0], axis = 0),
+                        'ST_high': np.quantile(STb, q[1], axis = 0)}, index = names)
+    out.attrs = {'output': output, 'n': n, 'runs': len(table),
+                 'variance': np.concatenate([table[output][role == 0], table[output][role < 0]]).var()}
+    return out;
+
+#%% Solving the design
+
+# Outputs of a variant over the Saltelli design of dists, in a pool of
+# processes (see uncertainty.evaluate). With cache (a CSV file) the solved
+# design is kept there, and points already in it are not solved again, so
+# the indices of a design, or of a larger one from the same seed (n a power
+# of two), can be worked out again from the cache alone. A cache of another
+# variant, other fixed parameters or other factors raises ValueError (see
+# uncertainty.readcache).
+def run(name, dists, n = 256, seed = 0, cache = None, processes = None, batch = 64, **params):
+    points = design(dists, n, seed)
+    names = list(dists)
+    key = lambda frame: [tuple(row) for row in np.round(frame[names].values.astype(float), 12)]
+    old = readcache(cache, name, names, params)
+    todo = points
+    if old is not None:
+        have = set(key(old))
+        todo = points[[k not in have for k in key(points)]]
+    work = None
+    if len(todo):
+        solved, work = evaluate(name, todo[names], processes = processes, batch = batch, **params)
+        solved = pd.concat([todo[['role', 'base']], solved], axis = 1)
+        old = solved if old is None else pd.concat([old, solved], ignore_index = True)
+        if cache is not None:
+            writecache(cache, old, name, names, params,
+                       [c for c in old.columns if c not in names + ['role', 'base']])
+    lookup = dict(zip(key(old), range(len(old))))
+    table = old.drop(columns = ['role', 'base']).iloc[[lookup[k] for k in key(points)]]
+    table = pd.concat([points[names + ['role', 'base']].reset_index(drop = True),
+                       table.drop(columns = names).reset_index(drop = True)], axis = 1)
+    return table, work;
+
+#%% Run from the command line
+
+# Sobol indices of D17_O2t (and any other outputs) over the factors of a
+# variant, e.g.
+#     python sensitivity.py sbmodWBrmchem2comp --n 256 --cache sobol.csv
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Sobol sensitivity indices by Saltelli sampling')
+    parser.add_argument('variant', nargs = '?', default = 'sbmodWBrmchem2comp', choices = list(variants))
+    parser.add_argument('--factors', nargs = '+', default = candidates)
+    parser.add_argument('--n', type = int, default = 256, help = 'base samples, a power of two')
+    parser.add_argument('--outputs', nargs = '+', default = ['D17_O2t'])
+    parser.add_argument('--cache', default = None, help = 'CSV file of the solved design')
+    parser.add_argument('--processes', type = int, default = None)
+    parser.add_argument('--resamples', type = int, default = 1000)
+    args = parser.parse_args(argv)
+
+    dists = factors(args.variant, args.factors)
+    table, work = run(args.variant, dists, args.n, cache = args.cache, processes = args.processes)
+    if work is None:
+        print('%s: %d runs, all from %s' % (args.variant, len(table), args.cache))
+    else:
+        print('%s: %d runs, %d solved in %.1f s, %s' % (args.variant, len(table), len(work),
+              work.attrs['wall_s'], work['method'].value_counts().to_dict()))
+    for output in args.outputs:
+        out = analyse(table, output, args.resamples)
+        print('%s: variance %.3e, %d base samples, sum of first order indices %.2f' % (output,
+              out.attrs['variance'], out.attrs['n'], out['S1'].sum()))
+        print(out.sort_values('ST', ascending = False).to_string(float_format = '%.3f'))
+    return table;
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 09:40:02 2026
+
+@author: david
+"""
+
+#%% Load packages
+import json
+import time
+import logging
+import numpy as np
+from scipy.integrate import odeint, solve_ivp, ode, LSODA, BDF, Radau
+
+#%% Integrators
+
+# Methods accepted by steady, odeint is what the model scripts use
+methods = ['odeint', 'LSODA', 'BDF', 'Radau']
+
+# solve_ivp stepper classes, used when a run is checked as it goes
+steppers = {'LSODA': LSODA, 'BDF': BDF, 'Radau': Radau}
+
+# Diagnostics of every steady solve are logged here as one JSON line
+logger = logging.getLogger('young2014.solve')
+
+# odeint default tolerances; solve_ivp gets the same when rtol or atol is
+# None so that methods are comparable
+deftol = 1.49012e-8
+
+# Integrate f from y0 over the times t and return the states at t and the
+# solver work. info['hu'] is the last step size taken and info['switches']
+# the number of changes between the non-stiff (1) and stiff (2) methods seen
+# at the output times (odeint only, None for solve_ivp). h0 is the first
+# step to try; a run that starts from a steady state needs one, since the
+# derivatives there are rounding noise and LSODA's own estimate fails.
+# tcrit are times the solver must not step across (odeint only).
+#
+# With scale (the magnitude of every species, see magnitudes) the solver
+# works in the nondimensional state y / scale, and rtol and atol apply to
+# it; atol then defaults to reach times rtol.
+#
+# With positive no species is allowed below zero (see nonnegative).
+def integrate(f, y0, t, method = 'odeint', rtol = None, atol = None,
+              mxstep = 1000000, h0 = None, tcrit = None, scale = None,
+              positive = False):
+    if scale is not None:
+        f, y0, rtol, atol = scaled(f, y0, scale, rtol, atol)
+        y, info = integrate(f, y0, t, method, rtol, atol, mxstep, h0, tcrit,
+                            positive = positive)
+        return y * scale, info;
+    if positive:
+        return nonnegative(f, y0, t, method, rtol, atol, mxstep, h0);
+    if method == 'odeint':
+        y, out = odeint(f, y0, t, rtol = rtol, atol = atol, mxstep = mxstep,
+                        h0 = 0.0 if h0 is None else h0, tcrit = tcrit,
+                        full_output = True)
+        mused = np.append(1, out['mused'])
+        info = {'nst': int(out['nst'][-1]), 'nfe': int(out['nfe'][-1]),
+                'nje': int(out['nje'][-1]), 'hu': float(out['hu'][-1]),
+                'mused': int(mused[-1]),
+                'switches': int(np.sum(mused[1:] != mused[:-1])),
+                'message': out['message'],
+                'success': out['message'] == 'Integration successful.'}
+        return y, info
+    sol = solve_ivp(lambda ti, yi: f(yi, ti), (t[0], t[-1]), y0,
+                    method = method, t_eval = t, first_step = h0,
+                    rtol = deftol if rtol is None else rtol,
+                    atol = deftol if atol is None else atol)
+    y = np.asarray(sol.y, dtype = float).reshape(len(y0), -1).T
+    if not sol.success:
+        y = np.vstack([y, np.full((len(t) - len(y), len(y0)), np.nan)])
+    info = {'nst': None, 'nfe': sol.nfev, 'nje': sol.njev, 'hu': None,
+            'mused': None, 'switches': None,
+            'message': sol.message, 'success': sol.success}
+    return y, info;
+
+# Integrate f from y0 in one continuous run, handing back (t, y, info) at
+# each of the times in check so the caller can stop early. odeint cannot be
+# resumed, so it is driven through scipy.integrate.ode, which wraps the same
+# LSODA code; the solve_ivp methods are stepped directly.
+def stepper(f, y0, check, method = 'odeint', rtol = None, atol = None,
+            mxstep = 1000000, scale = None):
+    if scale is not None:
+        f, y0, rtol, atol = scaled(f, y0, scale, rtol, atol)
+        for ti, y, info in stepper(f, y0, check, method, rtol, atol, mxstep):
+            yield ti, y * scale, info
+        return
+    rtol = deftol if rtol is None else rtol
+    atol = deftol if atol is None else atol
+    if method == 'odeint':
+        r = ode(lambda ti, yi: f(yi, ti))
+        r.set_integrator('lsoda', rtol = rtol, atol = atol, nsteps = mxstep)
+        r.set_initial_value(y0, 0)
+        mused, switches = 1, 0
+        for ti in check:
+            y = r.integrate(ti)
+            # LSODA work counters, iwork(11:13), iwork(19) and rwork(11) in
+            # Fortran numbering
+            iwork, rwork = r._integrator.iwork, r._integrator.rwork
+            success = r.successful()
+            switches += int(iwork[18] != mused)
+            mused = int(iwork[18])
+            info = {'nst': int(iwork[10]), 'nfe': int(iwork[11]),
+                    'nje': int(iwork[12]), 'hu': float(rwork[10]),
+                    'mused': mused, 'switches': switches,
+                    'message': 'Integration successful.' if success
+                               else 'LSODA istate %d' % r.get_return_code(),
+                    'success': success}
+            yield ti, y, info
+            if not success:
+                return
+        return
+    solver = steppers[method](lambda ti, yi: f(yi, ti), 0, y0, check[-1],
+                              rtol = rtol, atol = atol)
+    for ti in check:
+        while solver.t < ti and solver.status == 'running':
+            solver.step()
+        success = solver.status != 'failed'
+        y = solver.dense_output()(ti) if success else np.full(len(y0), np.nan)
+        info = {'nst': None, 'nfe': solver.nfev, 'nje': solver.njev, 'hu': None,
+                'mused': None, 'switches': None,
+                'message': 'Integration successful.' if success
+                           else 'step size became too small',
+                'success': success}
+        yield ti, y, info
+        if not success:
+            return
+
+#%% Non-negative integration
+
+# Integrate f from y0 over the times t keeping every species at or above
+# zero. Loose tolerances let the radicals and the ozone of the spin-up from
+# the script seeds (O1Ds, X1Ds, Q1Ds, O3s) overshoot below zero, where the
+# isotope outputs take the log of a negative ratio. The run is stepped with
+# the solve_ivp stepper of method (LSODA for odeint, which is the same
+# code); after any step that leaves a species negative, the negative
+# species are set to zero and the stepper is restarted from there with the
+# step size it had reached. Interpolated outputs between steps are also
+# held at zero. info counts how often the constraint was active: 'active'
+# steps that were clipped (and restarted), 'clipped' the number of times
+# each species was set to zero, and 'outputs' the output values raised to
+# zero.
+def nonnegative(f, y0, t, method = 'odeint', rtol = None, atol = None,
+                mxstep = 1000000, h0 = None):
+    rtol = deftol if rtol is None else rtol
+    atol = deftol if atol is None else atol
+    method = 'LSODA' if method == 'odeint' else method
+    t = np.asarray(t, dtype = float)
+    y = np.full((len(t), len(y0)), np.nan)
+    y[0] = y0
+    rhs = lambda ti, yi: f(yi, ti)
+    start = lambda ti, yi, h: steppers[method](rhs, ti, yi, t[-1], rtol = rtol,
+                                                atol = atol, first_step = h)
+    solver = start(t[0], np.asarray(y0, dtype = float), h0)
+    nfe, nje, nst, active, k = 0, 0, 0, 0, 1
+    clipped = np.zeros(len(y0), dtype = int)
+    while k < len(t) and nst < mxstep:
+        solver.step()
+        if solver.status == 'failed':
+            break
+        nst += 1
+        dense = solver.dense_output()
+        while k < len(t) and t[k] <= solver.t:
+            y[k] = dense(t[k])
+            k += 1
+        negative = solver.y < 0
+        if negative.any() and solver.status == 'running':
+            active += 1
+            clipped += negative
+            nfe, nje = nfe + solver.nfev, nje + solver.njev
+            solver = start(solver.t, np.where(negative, 0.0, solver.y),
+                           min(solver.step_size, t[-1] - solver.t))
+    outputs = int(np.sum(y < 0))
+    y = np.maximum(y, 0.0)
+    success = k == len(t)
+    info = {'nst': nst, 'nfe': nfe + solver.nfev, 'nje': nje + solver.njev,
+            'hu': solver.step_size, 'mused': None, 'switches': None,
+            'message': 'Integration successful.' if success
+                       else 'step size became too small' if solver.status == 'failed'
+                       else 'excess work done (mxstep)',
+            'success': success, 'active': active, 'clipped': clipped,
+            'outputs': outputs}
+    return y, info;
+
+#%% Scaled variables
+
+# Species magnitudes are never taken below floor moles, the size of the
+# seeds the scripts start the stratospheric radicals from
+floor = 1.0
+
+# Default atol of a scaled run as a fraction of rtol: every species is held
+# to rtol relative down to 1e-5 of its magnitude. With atol equal to rtol
+# the error test on the radicals (Q1Ds, X1Ds) fails repeatedly in most
+# variants.
+reach = 1e-5
+
+# Magnitude of every species in moles: its value in y when given (a steady
+# state, say), else the script's target moles, else its initial moles.
+def magnitudes(ns, y = None):
+    if y is None:
+        y = np.where(np.isfinite(ns['molest']), ns['molest'], ns['y0'])
+    return np.maximum(np.abs(y), floor);
+
+# f, y0 and tolerances for the nondimensional state z = y / scale
+def scaled(f, y0, scale, rtol = None, atol = None):
+    rtol = deftol if rtol is None else rtol
+    atol = reach * rtol if atol is None else atol
+    return (lambda z, t: f(z * scale, t) / scale), np.asarray(y0) / scale, rtol, atol;
+
+#%% Jacobian
+
+# Central difference Jacobian of f at y. Steps are relative to each species
+# because the moles span some forty orders of magnitude; a species at zero
+# (the scripts start O2s and O2t empty) gets an absolute step of eps moles.
+def jacobian(f, y, t = 0, eps = 1e-6):
+    y = np.asarray(y, dtype = float)
+    J = np.zeros((len(y), len(y)))
+    for j in range(len(y)):
+        h = eps * abs(y[j]) if y[j] != 0 else eps
+        up, down = y.copy(), y.copy()
+        up[j] += h
+        down[j] -= h
+        J[:, j] = (f(up, t) - f(down, t)) / (2 * h)
+    return J;
+
+# Species f never changes (the biosphere reservoirs are held constant), as
+# a boolean mask over moleso. Their rows of the Jacobian are zero, which
+# makes it singular, so they are left out wherever it is solved or factored.
+def constant(ns, y = None):
+    y = ns['y0'] if y is None else y
+    J = jacobian(ns['f'], y)
+    return ~J.any(axis = 1) & (ns['f'](y, 0) == 0);
+
+#%% Diagnostics
+
+# Time at which each species last came within conv (relative) of its final
+# value, from the states y at the times t. Species that never leave their
+# final value (e.g. the constant biosphere reservoirs) converge at t[0].
+def tconverge(t, y, conv = 1e-6):
+    y = np.asarray(y, dtype = float)
+    off = np.abs(y - y[-1]) > conv * np.maximum(np.abs(y[-1]), 1e-30)
+    last = np.where(off.any(axis = 0), len(t) - 1 - np.argmax(off[::-1], axis = 0), -1)
+    return np.asarray(t)[np.minimum(last + 1, len(t) - 1)];
+
+# Diagnostics record of a solve as one JSON log line
+def logline(info):
+    return json.dumps(info, default = lambda value: value.item()
+                      if isinstance(value, np.generic) else str(value));
+
+#%% Steady state solve
+
+# Integrate a loaded model to its steady state. Output is requested on a
+# log spaced grid instead of the scripts' 0.1 year grid, so the solver is
+# free to take long steps once the fast chemistry has relaxed. The end time
+# defaults to the script's own horizon (1e6 years).
+#
+# With stop set, the state is checked at every decade of time and the run
+# ends early once no species changed by more than stop (relative) over the
+# last decade. info['tstop'] is the time the run actually reached.
+#
+# With scale the solver works in nondimensional variables (see integrate);
+# scale = True takes the magnitudes from the script's target moles. With
+# positive no species goes below zero (see nonnegative), and
+# info['clipped'] is keyed by moleso; positive runs need a fixed horizon.
+#
+# info is the diagnostics record of the solve: solver work (nst, nfe, nje),
+# stiff/non-stiff switches, wall time, and info['tconv'], the time each
+# species (keyed by moleso) took to settle within conv of its final value,
+# resolved to the output grid. It is also logged as a JSON line on logger.
+def steady(ns, y0 = None, tend = None, rtol = None, atol = None,
+           method = 'odeint', stop = None, mxstep = 1000000, npts = 121,
+           conv = 1e-6, scale = None, positive = False):
+    if positive and stop is not None:
+        raise ValueError('positive runs need a fixed horizon (stop = None)')
+    if y0 is None:
+        y0 = ns['y0']
+    if scale is True:
+        scale = magnitudes(ns)
+    if tend is None:
+        tend = ns['tgrid'][1]
+    t0 = time.perf_counter()
+    if stop is None:
+        t = np.append(0, np.logspace(-6, np.log10(tend), npts))
+        y, info = integrate(ns['f'], y0, t, method, rtol, atol, mxstep,
+                            scale = scale, positive = positive)
+        info['tstop'] = tend
+    else:
+        # Decade by decade until the state stops changing
+        check = 10.0 ** np.arange(-6, np.ceil(np.log10(tend)) + 1)
+        check = np.append(check[check < tend], tend)
+        t, y = [0], [np.asarray(y0, dtype = float)]
+        for ti, yi, info in stepper(ns['f'], y0, check, method, rtol, atol, mxstep, scale):
+            info['tstop'] = ti
+            change = np.max(np.abs(yi - y[-1]) / np.maximum(np.abs(yi), 1e-30))
+            t.append(ti)
+            y.append(yi)
+            if ti > 1 and change < stop:
+                break
+    info['wall_s'] = time.perf_counter() - t0
+    info = dict({'variant': ns.get('variant'), 'params': ns.get('params'),
+                 'method': method, 'rtol': rtol, 'atol': atol,
+                 'scaled': scale is not None, 'positive': positive}, **info)
+    if positive:
+        info['clipped'] = dict(zip(ns['moleso'], info['clipped'].tolist()))
+    info['tconv'] = dict(zip(ns['moleso'], tconverge(t[:len(y)], y, conv).tolist()))
+    logger.info(logline(info))
+    return y[-1], info;
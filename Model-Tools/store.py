@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 00:18:27 2026
+
+@author: david
+"""
+
+#%% Load packages
+import os
+import json
+import glob
+import itertools
+import argparse
+import numpy as np
+import pandas as pd
+
+#%% Layout
+
+# A result cube on disk is a folder holding meta.json (the values of every
+# parameter axis, the names of the output variables and the chunk shape)
+# and one compressed .npz file per chunk. A chunk covers a block of every
+# parameter axis and of the variables, and holds the values (NaN where no
+# point has been written) and a mask of the points written, so outputs
+# that are NaN themselves are told apart from missing points. Only the
+# chunks a read or an append touches are opened.
+
+# Points per chunk, as near as the axis lengths allow, and variables per
+# chunk. Chunks are filled from the fastest varying axis, so the line a
+# grid finishes lands in as few chunks as possible.
+chunk = 256
+varchunk = 8
+
+# Points per chunk along each axis: the whole of the fastest axes, then
+# as much of the next as still fits in chunk points
+def chunkshape(axes, points = chunk):
+    sizes = []
+    for values in reversed(list(axes.values())):
+        sizes.insert(0, int(max(1, min(len(values), points))))
+        points = max(1, points // sizes[0])
+    return sizes;
+
+def metapath(path):
+    return os.path.join(path, 'meta.json');
+
+def chunkpath(path, key):
+    return os.path.join(path, 'c' + '-'.join(str(k) for k in key) + '.npz');
+
+# Create an empty store for the parameter axes (name: values, slowest
+# first) and the output variables. chunks overrides the points per chunk
+# of any axis, and 'variables' the variables per chunk.
+def create(path, axes, variables, chunks = {}, overwrite = False):
+    if os.path.exists(metapath(path)) and not overwrite:
+        raise FileExistsError('%s already holds a result cube' % path)
+    os.makedirs(path, exist_ok = True)
+    for old in glob.glob(os.path.join(path, 'c*.npz')):
+        os.remove(old)
+    meta = {'axes': {name: np.asarray(values, dtype = float).tolist()
+                     for name, values in axes.items()},
+            'variables': list(variables),
+            'chunks': [int(chunks.get(name, size)) for name, size in zip(axes, chunkshape(axes))]
+                      + [int(chunks.get('variables', varchunk))]}
+    with open(metapath(path), 'w') as file:
+        json.dump(meta, file, indent = 1)
+    return meta;
+
+def meta(path):
+    with open(metapath(path)) as file:
+        return json.load(file);
+
+#%% Indexing
+
+# Position of each value on an axis; values must be points of the axis
+def positions(values, axis):
+    values, axis = np.atleast_1d(np.asarray(values, dtype = float)), np.asarray(axis)
+    pos = np.abs(axis[None, :] - values[:, None]).argmin(axis = 1)
+    off = ~np.isclose(axis[pos], values, rtol = 1e-12, atol = 0)
+    if off.any():
+        raise KeyError('%s not on the axis' % values[off])
+    return pos;
+
+# Positions selected on every axis by the keyword arguments of read: a
+# value, a list of values, or a (low, high) tuple of values, inclusive
+def selection(m, select):
+    picks = []
+    for name, axis in m['axes'].items():
+        axis = np.asarray(axis)
+        if name not in select:
+            picks.append(np.arange(len(axis)))
+            continue
+        value = select[name]
+        if isinstance(value, tuple):
+            picks.append(np.where((axis >= value[0]) & (axis <= value[1]))[0])
+        else:
+            picks.append(positions(value, axis))
+    return picks;
+
+def loadchunk(path, key, shape):
+    name = chunkpath(path, key)
+    if not os.path.exists(name):
+        return np.full(shape, np.nan), np.zeros(shape[:-1], dtype = bool)
+    with np.load(name) as data:
+        return data['values'], data['done'];
+
+# Write a chunk through a temporary file, so a reader never sees half of it
+def savechunk(path, key, values, done):
+    name = chunkpath(path, key)
+    temp = name[:-4] + '.tmp.npz'
+    np.savez_compressed(temp, values = values, done = done)
+    os.replace(temp, name)
+
+#%% Writing and reading
+
+# Write the outputs of finished points. points is a DataFrame of axis
+# values (or a MultiIndex, e.g. the index of a grid cube) and values a
+# DataFrame with the store's variables as columns, one row per point.
+# Points are grouped by chunk, so each chunk touched is rewritten once.
+def append(path, points, values):
+    m = meta(path)
+    names = list(m['axes'])
+    if isinstance(points, pd.MultiIndex):
+        points = points.to_frame(index = False)
+    pos = np.column_stack([positions(points[name].values, m['axes'][name]) for name in names])
+    values = values.reindex(columns = m['variables']).values
+    sizes = m['chunks']
+    nvar = len(m['variables'])
+    for vk in range(int(np.ceil(nvar / sizes[-1]))):
+        vs = slice(vk * sizes[-1], min((vk + 1) * sizes[-1], nvar))
+        keys = pos // np.array(sizes[:-1])
+        for key in np.unique(keys, axis = 0):
+            rows = np.all(keys == key, axis = 1)
+            shape = tuple(sizes[:-1]) + (sizes[-1],)
+            block, done = loadchunk(path, tuple(key) + (vk,), shape)
+            local = tuple((pos[rows] - key * np.array(sizes[:-1])).T)
+            block[local + (slice(0, vs.stop - vs.start),)] = values[rows, vs]
+            done[local] = True
+            savechunk(path, tuple(key) + (vk,), block, done)
+
+# Read part of a cube: the variables asked for (all by default) at the
+# points selected by axis (see selection). Only the chunks that overlap
+# the selection are loaded. Returns a DataFrame indexed by the axes, with
+# the points not yet written left out unless missing is True.
+def read(path, variables = None, missing = False, **select):
+    m = meta(path)
+    names, sizes = list(m['axes']), m['chunks']
+    variables = m['variables'] if variables is None else list(variables)
+    vpos = np.array([m['variables'].index(name) for name in variables], dtype = int)
+    picks = selection(m, select)
+    out = np.full([len(p) for p in picks] + [len(variables)], np.nan)
+    done = np.zeros(out.shape[:-1], dtype = bool)
+    shape = tuple(sizes[:-1]) + (sizes[-1],)
+    axkeys = [np.unique(p // size) for p, size in zip(picks, sizes)]
+    for vk in np.unique(vpos // sizes[-1]):
+        vin = np.where(vpos // sizes[-1] == vk)[0]
+        for key in itertools.product(*axkeys):
+            if not os.path.exists(chunkpath(path, key + (vk,))):
+                continue
+            block, written = loadchunk(path, key + (vk,), shape)
+            into = [np.where(p // size == k)[0] for p, size, k in zip(picks, sizes, key)]
+            local = [picks[a][into[a]] - key[a] * sizes[a] for a in range(len(names))]
+            out[np.ix_(*into, vin)] = block[np.ix_(*local, vpos[vin] - vk * sizes[-1])]
+            done[np.ix_(*into)] = written[np.ix_(*local)]
+    index = pd.MultiIndex.from_product([np.asarray(m['axes'][name])[p]
+                                        for name, p in zip(names, picks)], names = names)
+    cube = pd.DataFrame(out.reshape(-1, len(variables)), index = index, columns = variables)
+    return cube if missing else cube[done.ravel()];
+
+# Which points have been written, as a boolean Series over every point
+def written(path):
+    m = meta(path)
+    first = m['variables'][:1]
+    cube = read(path, first, missing = True)
+    done = read(path, first)
+    return pd.Series(cube.index.isin(done.index), index = cube.index);
+
+#%% Run from the command line
+
+# Summary of a store and a partial read, e.g.
+#     python store.py gppco2 --variables D17_O2t --select ppmCO2=294
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Chunked result cube stores')
+    parser.add_argument('path')
+    parser.add_argument('--variables', nargs = '+', default = None)
+    parser.add_argument('--select', nargs = '+', default = [], metavar = 'AXIS=VALUE')
+    args = parser.parse_args(argv)
+
+    m = meta(args.path)
+    done = written(args.path)
+    files = glob.glob(os.path.join(args.path, 'c*.npz'))
+    print('%s: axes %s, %d variables, %d of %d points written, %d chunks, %.1f kB' % (args.path,
+          {name: len(values) for name, values in m['axes'].items()}, len(m['variables']),
+          done.sum(), len(done), len(files), sum(os.path.getsize(f) for f in files) / 1e3))
+    select = {}
+    for item in args.select:
+        name, value = item.split('=')
+        select[name] = float(value)
+    print(read(args.path, args.variables, **select).to_string())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 06:14:52 2026
+
+@author: david
+"""
+
+#%% Load packages
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from modelload import variants, loadmodel, outputs
+from newton import sweep
+
+#%% Oxygen uptake fractions
+
+# O2 production budget of Y14tGAMR.py and tGAcalc.py: terrestrial carbon
+# flux (Zhang1996), C3 and C4 fractions (Francois1998), photosynthetic
+# quotient (Keeling 1988), the terrestrial Mehler fraction (Badger2000),
+# AOX relative to COX (Angert2003), pre-industrial CO2, the leaf to air
+# partial pressure ratio and CO2 compensation point of photorespiration,
+# the marine carbon flux (Field1998), the ratio of 14C production to gross
+# O2 production (Blunier 2002) and the marine Mehler fraction
+budget = {'FCt': 9.4e15, 'fC3': 0.725, 'fC4': 0.275, 'pQ': 1.07, 'fMRt': 0.1, 'fAOXCOX': 0.1,
+          'CO2': 281, 'pipa': 0.65, 'T': 34, 'FCm': 4.04e15, 'C14O2': 0.37, 'fMRm': 0.0}
+
+# Uptake pathways in the order of the fractions and thetas
+pathways = ['COX', 'PR', 'MRt', 'MRm', 'AOX']
+
+# (dark respiration + photorespiration) / (dark respiration)
+def DRPR(CO2, pipa, T):
+    DRPR = (4.5 / 4) * (CO2 * pipa + (7 / 3) * T) / (CO2 * pipa - T)
+    return DRPR;
+
+# Fractions of global O2 uptake by cytochrome oxidase, photorespiration,
+# terrestrial and marine Mehler reaction and alternative oxidase, worked
+# out as the scripts do for each marine Mehler fraction. Keyword arguments
+# replace the values of budget and may be arrays, which broadcast, so a
+# grid of any of them is one call. Returns fCOX, fPR, fMRt, fMRm and fAOX.
+def fractions(**given):
+    b = {key: np.asarray(value, dtype = float) for key, value in dict(budget, **given).items()}
+    drpr = DRPR(b['CO2'], b['pipa'], b['T'])
+
+    # Terrestrial production, and the parts of it taken by the Mehler
+    # reaction and by photorespiration
+    FO2C4t = b['FCt'] * b['pQ'] * b['fC4']
+    FO2C3t = b['FCt'] * b['pQ'] * b['fC3'] * drpr
+    FO2MRt = (FO2C4t + FO2C3t) * (1 / (1 - b['fMRt']) - 1)
+    FO2PRt = FO2C3t - FO2C3t / drpr
+    FO2t = FO2C4t + FO2C3t + FO2MRt
+
+    # Marine production, and the part of it taken by the Mehler reaction
+    FO2m = b['FCm'] * (1 / b['C14O2'])
+    FO2MRm = FO2m * (1 / (1 - b['fMRm'])) - FO2m
+    FO2g = FO2t + FO2m + FO2MRm
+
+    fPR = FO2PRt / FO2g
+    fMRt = FO2MRt / FO2g
+    fMRm = FO2MRm / FO2g
+    fAOX = (1 - fPR - fMRt - fMRm) * b['fAOXCOX']
+    fCOX = 1 - fPR - fMRt - fMRm - fAOX
+    return np.broadcast_arrays(fCOX, fPR, fMRt, fMRm, fAOX);
+
+#%% Global average respiration theta
+
+# Thetas of the uptake pathways measured at the Hebrew University (tCOX,
+# tMR of pea and Synechocystis from Helman2005, tPR and tAOX from
+# Angert2003) and at Rice University (tCOX from Ash 2019, the rest offset
+# by 0.004)
+labs = pd.DataFrame({'HU': [0.516, 0.512, 0.526, 0.497, 0.514],
+                     'RU': [0.520, 0.516, 0.530, 0.501, 0.518]},
+                    index = ['t' + p for p in pathways]).T
+
+# Function determining tGA, as in the scripts
+def tGA(fCOX, tCOX, fPR, tPR, fMRt, tMRt, fMRm, tMRm, fAOX, tAOX):
+    tGA = fCOX * tCOX + fPR * tPR + fMRt * tMRt + fMRm * tMRm + fAOX * tAOX
+    return tGA;
+
+# Table of the fractions at points (rows, in the order of pathways) over
+# the product of axes (name: values, slowest first), and tGA at each for
+# every set of thetas (rows of a DataFrame with the columns of labs), as one
+# matrix product. Returns a table indexed by theta set and the axes.
+def mix(f, axes, thetas):
+    t = f @ thetas[['t' + p for p in pathways]].values.T
+    index = pd.MultiIndex.from_product([thetas.index] + [np.asarray(v, dtype = float) for v in axes.values()],
+                                       names = ['thetas'] + list(axes))
+    out = pd.DataFrame(np.tile(f, (len(thetas), 1)), index = index, columns = ['f' + p for p in pathways])
+    out['tGA'] = t.T.ravel()
+    return out;
+
+# tGA over the product of axes of budget parameters (name: values, slowest
+# first), with the other budget parameters at values given as keyword
+# arguments or in budget. The axes are the inputs of the scripts, not the
+# uptake fractions: fMRt and fMRm here are the Mehler shares of terrestrial
+# and marine production, and fAOXCOX the ratio of AOX to COX, from which
+# fractions works out the shares of global uptake fCOX, fPR, fMRt, fMRm
+# and fAOX that tGA weights (see mixture for axes over those directly).
+def table(axes = {'fMRm': np.arange(6) / 10}, thetas = labs, **fixed):
+    names = list(axes)
+    mesh = np.meshgrid(*[np.asarray(axes[p], dtype = float) for p in names], indexing = 'ij')
+    f = np.stack([part.ravel() for part in fractions(**dict(fixed, **dict(zip(names, mesh))))], axis = 1)
+    return mix(f, axes, thetas);
+
+# tGA over the product of axes of the uptake fractions themselves (name:
+# values, any of fCOX, fPR, fMRt, fMRm and fAOX, slowest first). Fractions
+# not on an axis are held at values given as keyword arguments, or at those
+# of budget, except rest, which takes up what is left so that they sum to
+# one; points where it would be negative are left out.
+def mixture(axes, thetas = labs, rest = 'fCOX', **fixed):
+    columns = ['f' + p for p in pathways]
+    names = list(axes)
+    if rest in axes or rest in fixed or not set(names) | set(fixed) <= set(columns):
+        raise ValueError('axes and fixed take fractions among %s other than %s' % (', '.join(columns), rest))
+    mesh = np.meshgrid(*[np.asarray(axes[p], dtype = float) for p in names], indexing = 'ij')
+    f = dict(zip(columns, [float(v) for v in fractions()]), **fixed, **dict(zip(names, mesh)))
+    f[rest] = 1 - sum(np.asarray(f[c]) for c in columns if c != rest)
+    f = np.stack([np.broadcast_to(f[c], mesh[0].shape).ravel() for c in columns], axis = 1)
+    out = mix(np.where(np.abs(f) < 1e-12, 0.0, f), axes, thetas)
+    return out[out[rest] >= 0];
+
+#%% Model sweep
+
+# Steady state outputs of a variant at every tGA of a table (see table), as
+# the respiration theta of its script (tGA, or tresp where the script has
+# no tGA). The distinct values are solved once each, in order, by
+# continuation (newton.sweep), and the outputs of all of them are worked
+# out in one call of the output cells, which do not read the theta.
+# Keyword arguments are script parameters held fixed (e.g. ft). Returns the
+# table with the outputs joined and the solver work.
+def solve(name, tga, **params):
+    ns = loadmodel(name, **params)
+    param = 'tGA' if 'tGA' in ns else 'tresp'
+    values, where = np.unique(tga['tGA'].values, return_inverse = True)
+    states, work = sweep(name, param, values, **params)
+    out = pd.concat(outputs(ns, states), axis = 1)
+    out = out.iloc[where].set_index(tga.index)
+    return pd.concat([tga, out], axis = 1), work;
+
+#%% Run from the command line
+
+# tGA over the marine Mehler fractions of Y14tGAMR.py (or any axes of
+# budget, or with --fractions of the uptake fractions) for the Hebrew and
+# Rice University thetas, and D17_O2t of a variant at each, e.g.
+#     python tga.py Y14WB2 --axis fMRm 0 0.5 11 --axis fMRt 0 0.2 5
+#     python tga.py Y14WB2 --fractions --axis fPR 0.1 0.3 5 --axis fAOX 0 0.1 3
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Global average respiration theta and its D17_O2t')
+    parser.add_argument('variant', nargs = '?', default = 'Y14WB2', choices = list(variants))
+    parser.add_argument('--axis', nargs = 4, action = 'append',
+                        metavar = ('NAME', 'START', 'STOP', 'NUM'),
+                        help = 'axis NAME of budget with NUM values from START to STOP, slowest first')
+    parser.add_argument('--fractions', action = 'store_true',
+                        help = 'axes are uptake fractions, fCOX taking up the rest (see mixture)')
+    parser.add_argument('--labs', nargs = '+', default = list(labs.index), choices = list(labs.index))
+    parser.add_argument('--ft', type = float, default = None)
+    parser.add_argument('--outputs', nargs = '+', default = ['D17_O2t', 'd18_O2t'])
+    parser.add_argument('--out', default = None, help = 'CSV file for the table')
+    args = parser.parse_args(argv)
+
+    spec = args.axis or [('fMRm', 0, 0.5, 6)]
+    axes = {axis: np.linspace(float(start), float(stop), int(num)) for axis, start, stop, num in spec}
+    t0 = time.perf_counter()
+    tga = mixture(axes, labs.loc[args.labs]) if args.fractions else table(axes, labs.loc[args.labs])
+    t1 = time.perf_counter()
+    params = {} if args.ft is None else {'ft': args.ft}
+    result, work = solve(args.variant, tga, **params)
+    print('%d tGA values in %.2f ms, %d distinct solved in %.2f s, nfe %d, %s' % (len(tga), 1e3 * (t1 - t0),
+          len(work), work['wall_s'].sum(), work['nfe'].sum(), work['method'].value_counts().to_dict()))
+    print(result[['tGA'] + args.outputs].to_string(float_format = '%.5f'))
+    if args.out:
+        result.to_csv(args.out)
+    return result;
+
+if __name__ == '__main__':
+    main()
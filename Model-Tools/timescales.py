@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 14:37:05 2026
+
+@author: david
+"""
+
+#%% Load packages
+import argparse
+import numpy as np
+import pandas as pd
+from modelload import variants, loadmodel
+from solve import steady, jacobian, constant
+
+#%% Relaxation modes
+
+# Modes slower than tcons years are conserved quantities (total carbon,
+# total oxygen of a closed set of boxes) rather than relaxations; their
+# eigenvalues are zero up to rounding. Modes faster than tres years are the
+# stratospheric photochemistry, which sits in quasi-equilibrium with the
+# slower boxes (there is a gap of three decades between the two groups) and
+# never needs to be resolved by the output grid.
+tcons = 1e9
+tres = 1e-3
+
+# Eigen decomposition of the Jacobian at the steady state y, in relative
+# units (J scaled by the steady state moles) so that species of very
+# different size are comparable. Constant species are left out.
+def spectrum(ns, y):
+    fixed = constant(ns, y)
+    scale = y[~fixed]
+    J = jacobian(ns['f'], y)[np.ix_(~fixed, ~fixed)]
+    J = J * scale[None, :] / scale[:, None]
+    rates, right = np.linalg.eig(J)
+    left = np.linalg.inv(right)
+    return rates, right, left, np.asarray(ns['moleso'])[~fixed], fixed;
+
+# Relaxation time of every mode at the steady state, slowest first, with the
+# species that takes most part in it. Participation of a species in a mode
+# is the product of its left and right eigenvector components, normalised
+# over the mode, so it does not depend on how the state is scaled.
+def modes(ns, y = None):
+    if y is None:
+        y = steady(ns)[0]
+    rates, right, left, species, fixed = spectrum(ns, y)
+    part = np.abs(right * left.T)
+    part = part / part.sum(axis = 0)
+    tau = -1 / rates.real
+    kind = np.where(np.abs(tau) > tcons, 'conserved',
+                    np.where(tau < tres, 'fast', 'relaxing'))
+    table = pd.DataFrame({'tau': tau, 'rate': rates.real, 'imag': rates.imag,
+                          'kind': kind, 'species': species[part.argmax(axis = 0)],
+                          'participation': part.max(axis = 0)})
+    return table.sort_values('tau', ascending = False, key = np.abs).reset_index(drop = True);
+
+#%% Horizon and output spacing
+
+# Shortest run from y0 that brings every relaxing mode within conv
+# (relative) of the steady state y. Each mode decays as exp(-t / tau) from
+# its share of the initial departure, so it needs tau * ln(amplitude / conv).
+# Without y0 every mode starts at a relative amplitude of one.
+def horizon(ns, y = None, y0 = None, conv = 1e-6):
+    if y is None:
+        y = steady(ns, y0 = y0)[0]
+    rates, right, left, species, fixed = spectrum(ns, y)
+    tau = -1 / rates.real
+    if y0 is None:
+        amp = np.ones(len(tau))
+    else:
+        amp = np.abs(left @ ((np.asarray(y0) - y)[~fixed] / y[~fixed]))
+    need = (tau > tres) & (tau < tcons) & (amp > conv)
+    if not need.any():
+        return 0.0
+    return float(np.max(tau[need] * np.log(amp[need] / conv)));
+
+# Output step of the transient scripts (Young2014anthroCO2.py,
+# Young2014HalfNPP.py) in years, and the most points of a transient grid
+tstep = 0.1
+maxpoints = 100000
+
+# Output times for a run from y0 to the steady state y. Steady state runs get
+# a log spaced grid from the fastest resolved mode out to the horizon, per
+# points a decade; transient runs get an even grid spaced at the fastest
+# resolved mode over per, but no finer than the scripts' output step (the
+# fastest resolved mode is a fraction of a year, and over a horizon of
+# thousands of years that spacing comes to ~1e7 points) and no finer than
+# takes maxpoints. Returns (t, dt) with dt the spacing of the transient
+# grid either way.
+def outputgrid(ns, kind = 'steady', y = None, y0 = None, conv = 1e-6, per = 10):
+    if y is None:
+        y = steady(ns, y0 = y0)[0]
+    table = modes(ns, y)
+    tfast = table.loc[table['kind'] == 'relaxing', 'tau'].min()
+    tend = horizon(ns, y, y0, conv)
+    if kind == 'steady':
+        dt = tfast / per
+        ndec = max(np.log10(tend / dt), 1)
+        t = np.append(0, np.logspace(np.log10(dt), np.log10(tend), int(ndec * per) + 1))
+    else:
+        dt = max(tfast / per, tstep, tend / maxpoints)
+        t = np.arange(0, tend + dt, dt)
+    return t, dt;
+
+#%% Run from the command line
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Relaxation timescales and integration horizon of the model variants')
+    parser.add_argument('variants', nargs = '*', default = list(variants))
+    parser.add_argument('--conv', type = float, default = 1e-6)
+    parser.add_argument('--modes', action = 'store_true', help = 'print every mode')
+    args = parser.parse_args(argv)
+
+    print('%-20s %10s %10s %12s %10s %10s' % ('variant', 'slowest', 'species',
+          'horizon', 'dt', 'script'))
+    for name in args.variants:
+        ns = loadmodel(name)
+        y = steady(ns)[0]
+        table = modes(ns, y)
+        slow = table[table['kind'] == 'relaxing'].iloc[0]
+        t, dt = outputgrid(ns, 'transient', y, ns['y0'], args.conv)
+        print('%-20s %10.4g %10s %12.4g %10.3g %4.3g/%-5.3g' % (name, slow['tau'],
+              slow['species'], t[-1], dt, ns['tgrid'][1], ns['tgrid'][2]))
+        if args.modes:
+            print(table.to_string())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 15:52:26 2026
+
+@author: david
+"""
+
+#%% Load packages
+import time
+import numpy as np
+from modelload import loadmodel
+from solve import steady, integrate
+from fluxprofile import withvalues
+
+#%% Transient scenarios
+
+# The transient scripts (Young2014anthroCO2.py, Young2014HalfNPP.py) share
+# Young2014's equations and only change constants, so they are set up here
+# from the Young2014 variant. Each scenario is a dict holding the model to
+# integrate (ns), the unperturbed model (ns0), the pre-industrial steady
+# state (ypre), the initial state of the transient (y0) and the script's
+# output times (t).
+
+# Respiration theta used by both transient scripts
+tresp = 0.5149
+
+# Young2014anthroCO2.py: pre-industrial CO2 of 280 ppm, then stratospheric
+# and tropospheric CO2 set to 7.3e15 and 7.3e16 moles and run for 250 years
+def anthroCO2(tpost = 250, dt = 0.1):
+    ns = loadmodel('Young2014', tresp = tresp, CO2s0 = 4.8e15 * (280 / 270),
+                   CO2t0 = 4.8e16 * (280 / 270))
+    ypre = steady(ns)[0]
+    y0 = ypre.copy()
+    y0[list(ns['moleso']).index('CO2s')] = 7.3e15
+    y0[list(ns['moleso']).index('CO2t')] = 7.3e16
+    return {'name': 'anthroCO2', 'ns': ns, 'ns0': ns, 'ypre': ypre, 'y0': y0,
+            't': np.arange(0, tpost, dt)};
+
+# Young2014HalfNPP.py: photosynthesis (k21) halved from the pre-industrial
+# steady state and run for 3.5e4 years
+def halfNPP(tpost = 3.5e4, dt = 0.1):
+    ns = loadmodel('Young2014', tresp = tresp)
+    ypre = steady(ns)[0]
+    return {'name': 'HalfNPP', 'ns': withvalues(ns, k21 = 0.5 * ns['k21']),
+            'ns0': ns, 'ypre': ypre, 'y0': ypre.copy(), 't': np.arange(0, tpost, dt)};
+
+scenarios = {'anthroCO2': anthroCO2, 'HalfNPP': halfNPP}
+
+# First step of a transient; the runs start from a steady state where
+# LSODA cannot estimate one itself
+h0 = 1e-12
+
+# Reference run of a scenario the way the scripts do it, odeint on the
+# script's output grid. Returns the states at t and the solver diagnostics.
+def reference(scenario, rtol = None, atol = None):
+    t0 = time.perf_counter()
+    y, info = integrate(scenario['ns']['f'], scenario['y0'], scenario['t'],
+                        rtol = rtol, atol = atol, h0 = h0)
+    info['wall_s'] = time.perf_counter() - t0
+    return y, info;
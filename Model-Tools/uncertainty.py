@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 02:31:54 2026
+
+@author: david
+"""
+
+#%% Load packages
+import os
+import json
+import time
+import argparse
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
+from scipy import stats
+from scipy.stats import qmc
+from modelload import variants, loadmodel
+from newton import invariants
+from adapt import solveat
+from grid import knobs
+
+#%% Distributions
+
+# Fractionation parameters and the distributions they are drawn from by
+# default, spanning the literature values the scripts pick between:
+# tresp from the global average theta of the Hebrew University to the Rice
+# University theta sets (Y14tGAMR.py), tevap from Landais2006, tphoto from
+# LuzBarkan2011, isoevap from West2008 to Young2014, isophoto from
+# Eisenstadt2011 to Luz2014, alphari from Young2014 to Y14WB2 and
+# alphaCO2H2O from Beck2005 at 45 to 25 oC. Distributions are
+#     ('uniform', low, high)
+#     ('normal', mean, sd)
+#     ('triangular', low, mode, high)
+#     ('lognormal', median, sd of the log)
+#     ('loguniform', low, high)
+#     ('choice', value, value, ...)
+priors = {'tresp': ('uniform', 0.512, 0.520),
+          'tevap': ('normal', 0.519, 0.002),
+          'tphoto': ('normal', 0.525, 0.001),
+          'isoevap': ('uniform', 1.005, 1.006825),
+          'isophoto': ('uniform', 1.0029, 1.003389),
+          'alphari': ('uniform', 1 / 1.0182, 1 / 1.01695),
+          'alphaCO2H2O': ('uniform', 1.041, 1.0413)}
+
+# Continuous distribution (scipy.stats, frozen) of a distribution spec
+def distribution(spec):
+    kind, args = spec[0], spec[1:]
+    if kind == 'uniform':
+        return stats.uniform(args[0], args[1] - args[0])
+    if kind == 'normal':
+        return stats.norm(args[0], args[1])
+    if kind == 'triangular':
+        low, mode, high = args
+        return stats.triang((mode - low) / (high - low), low, high - low)
+    if kind == 'lognormal':
+        return stats.lognorm(args[1], scale = args[0])
+    if kind == 'loguniform':
+        return stats.loguniform(args[0], args[1])
+    raise ValueError('unknown distribution %s' % kind)
+
+# Inverse cumulative distribution of a distribution spec
+def quantile(spec):
+    if spec[0] == 'choice':
+        values = np.asarray(spec[1:], dtype = float)
+        return lambda u: values[np.minimum((np.asarray(u) * len(values)).astype(int), len(values) - 1)]
+    return distribution(spec).ppf;
+
+# Samples of the distributions (name: spec) from a scrambled Sobol
+# sequence; the same seed always gives the same samples. A Sobol sequence
+# only covers the distributions evenly in blocks of a power of two points,
+# so n is rounded up to one (100000 gives 131072), and start, the first
+# sample, must be a multiple of it. Returns samples start to start + n.
+def draw(dists, n, start = 0, seed = 0):
+    n = 2 ** int(np.ceil(np.log2(max(n, 1))))
+    if start % n:
+        raise ValueError('start must be a multiple of the %d samples drawn' % n)
+    u = qmc.Sobol(len(dists), seed = seed).random_base2(int(np.ceil(np.log2(start + n))))[start:start + n]
+    return pd.DataFrame({name: quantile(spec)(u[:, i]) for i, (name, spec) in enumerate(dists.items())},
+                        index = np.arange(start, start + n));
+
+#%% Propagation
+
+# Outputs of one batch of samples, each warm started from the nearest sample
+# of the batch solved before it, in units of spans. Samples left when the
+# deadline (time.time()) has passed are not solved.
+def solvebatch(task):
+    name, samples, spans, params, deadline = task
+    if time.time() > deadline:
+        return samples.iloc[:0].copy(), pd.DataFrame()
+    C = invariants(loadmodel(name, **params))
+    solved, rows, done = {}, [], []
+    for i, sample in samples.iterrows():
+        if time.time() > deadline:
+            break
+        point = sample.to_dict()
+        row = solveat(name, point, solved, C, spans, params)
+        rows.append(dict(row, sample = i))
+        done.append(dict(point, **solved[tuple(point.values())]['outputs']))
+    table = pd.DataFrame(done, index = samples.index[:len(done)])
+    return table, pd.DataFrame(rows);
+
+# Steady state outputs of a variant at samples of the parameters (a
+# DataFrame, one column per parameter or axis of grid.knobs), pushed through the model in batches
+# of neighbouring rows, in a pool of processes (processes = 1 runs them
+# here) until all are done or budget seconds have passed. Every parameter
+# must be set in the variant's script, and parameters that derive from them
+# (e.g. alphart from isoevap and alphari) follow. Keyword arguments are
+# script parameters held fixed. Returns a table of the samples solved and
+# their outputs, in order, and the solver work.
+def evaluate(name, samples, budget = np.inf, processes = None, batch = 64, **params):
+    ns = loadmodel(name, **params)
+    missing = [p for p in samples.columns if p not in ns and p not in knobs]
+    if missing:
+        raise KeyError('%s not set in the script of %s' % (', '.join(missing), name))
+    t0 = time.time()
+    deadline = t0 + budget
+    spans = list((samples.quantile(0.95) - samples.quantile(0.05)).replace(0, 1.0))
+    tasks = ((name, samples.iloc[start:start + batch], spans, params, deadline)
+             for start in range(0, len(samples), batch))
+    if processes == 1:
+        results = []
+        for task in tasks:
+            results.append(solvebatch(task))
+            if time.time() > deadline:
+                break
+    else:
+        with mp.get_context('spawn').Pool(processes) as pool:
+            results = []
+            for result in pool.imap(solvebatch, tasks):
+                results.append(result)
+                if time.time() > deadline:
+                    pool.terminate()
+                    break
+    table = pd.concat([r[0] for r in results])
+    work = pd.concat([r[1] for r in results], ignore_index = True)
+    work.attrs['wall_s'] = time.time() - t0
+    return table, work;
+
+# evaluate for samples drawn from dists (name: spec, see priors) until
+# either samples are done or budget seconds have passed
+def propagate(name, dists = priors, budget = 60.0, samples = 2 ** 17, processes = None,
+              batch = 64, seed = 0, **params):
+    return evaluate(name, draw(dists, samples, seed = seed), budget, processes, batch, **params);
+
+# Distribution of outputs over the samples: mean, standard deviation, the
+# standard error of the mean and percentiles, one row per output (the
+# isotope outputs that are finite by default)
+def summary(table, outputs = None, percentiles = (2.5, 16, 50, 84, 97.5)):
+    if outputs is None:
+        outputs = [c for c in table.columns if c[:2] in ['d1', 'D1'] and np.isfinite(table[c]).all()]
+    values = table[outputs]
+    out = pd.DataFrame({'mean': values.mean(), 'sd': values.std(),
+                        'se': values.std() / np.sqrt(len(values))})
+    for q in percentiles:
+        out['p%g' % q] = values.quantile(q / 100)
+    out.attrs['n'] = len(values)
+    return out;
+
+#%% Cached runs
+
+# A CSV cache of runs (parameters then outputs, one row per run) is kept
+# with a header in cache + '.json' naming the variant, the script
+# parameters held fixed, the parameters varied and the outputs. Runs are
+# looked up by parameter values alone, so a cache is only read back for
+# the same variant and fixed parameters; any other raises ValueError, as
+# does a cache without a header.
+def header(name, factors, params = {}, outputs = None):
+    head = {'variant': name, 'params': {key: float(value) for key, value in sorted(params.items())},
+            'factors': list(factors)}
+    if outputs is not None:
+        head['outputs'] = list(outputs)
+    return head;
+
+# Runs of a cache, or None if there is none yet; checked against the
+# header of this call (see header)
+def readcache(cache, name, factors, params = {}):
+    if cache is None or not os.path.exists(cache):
+        return None
+    if not os.path.exists(cache + '.json'):
+        raise ValueError('%s has no header (%s.json), so the runs it holds cannot be checked'
+                         % (cache, cache))
+    with open(cache + '.json') as file:
+        have = json.load(file)
+    want = header(name, factors, params)
+    differ = ['%s %s, not %s' % (key, have.get(key), want[key]) for key in want if have.get(key) != want[key]]
+    table = pd.read_csv(cache)
+    missing = [c for c in list(factors) + have.get('outputs', []) if c not in table.columns]
+    if missing:
+        differ.append('columns %s missing' % ', '.join(missing))
+    if differ:
+        raise ValueError('%s holds other runs: %s' % (cache, '; '.join(differ)))
+    return table;
+
+# Write a cache and its header
+def writecache(cache, table, name, factors, params = {}, outputs = None):
+    table.to_csv(cache, index = False)
+    with open(cache + '.json', 'w') as file:
+        json.dump(header(name, factors, params, outputs), file, indent = 1)
+
+#%% Run from the command line
+
+# Monte Carlo propagation of the default or given distributions through a
+# variant within a time budget, e.g.
+#     python uncertainty.py sbmodWB --budget 60 --param tresp choice 0.5149 0.520
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Monte Carlo uncertainty propagation')
+    parser.add_argument('variant', nargs = '?', default = 'sbmodWB', choices = list(variants))
+    parser.add_argument('--param', nargs = '+', action = 'append', metavar = ('NAME', 'KIND'),
+                        help = 'distribution of NAME: KIND and its numbers (see priors)')
+    parser.add_argument('--budget', type = float, default = 60.0, help = 'seconds')
+    parser.add_argument('--samples', type = int, default = 2 ** 17,
+                        help = 'rounded up to a power of two')
+    parser.add_argument('--processes', type = int, default = None)
+    parser.add_argument('--batch', type = int, default = 64)
+    parser.add_argument('--out', default = None, help = 'CSV file for the samples')
+    args = parser.parse_args(argv)
+
+    ns = loadmodel(args.variant)
+    dists = {p: spec for p, spec in priors.items() if p in ns}
+    for item in args.param or []:
+        dists[item[0]] = (item[1],) + tuple(float(v) for v in item[2:])
+    table, work = propagate(args.variant, dists, args.budget, args.samples, args.processes, args.batch)
+    print('%s: %d samples of %s in %.1f s (%.1f ms a sample), %s' % (args.variant, len(table),
+          ', '.join(dists), work.attrs['wall_s'], 1e3 * work['wall_s'].sum() / max(len(table), 1),
+          work['method'].value_counts().to_dict()))
+    print(summary(table).to_string(float_format = '%.5f'))
+    if args.out:
+        table.to_csv(args.out)
+    return table;
+
+if __name__ == '__main__':
+    main()